@@ -0,0 +1,358 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+import custom_io
+from graph import Graph
+from graphCut import graphCut
+from graphEnums import GenDirection, GenMethod, CostMethod
+from generate import getImages, getImagePaths
+from pixelization import getPalette, reduceColour, pixelizeP1, pixelizeP2
+
+# peak memory is only reported where the resource module exists
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+#---------- constants ----------#
+
+
+# names of the timed stages of a pipeline run
+STAGES = [ 'pixelize', 'generate', 'upscale' ]
+
+# differences from the baseline too small to be told from noise, in seconds and MB
+NOISE_FLOOR = { 'wall': 0.1, 'peak_memory_mb': 5 }
+
+# modules of optional features that starting the pipeline must not load
+LAZY_MODULES = [ 'sklearn', 'matplotlib', 'networkx', 'tkinter', 'PIL', 'imageio' ]
+
+# fresh interpreters started to time the startup, keeping the fastest
+STARTUP_REPEATS = 5
+
+
+#---------- functions ----------#
+
+
+# construct arguments for the benchmark
+def getArguments():
+    parser = argparse.ArgumentParser( description = 'Benchmark placement cost backends and palette extraction' )
+
+    parser.add_argument( '--benchmarks', type = str, nargs = '+', default = [ 'cost', 'palette' ],
+            choices = [ 'cost', 'palette', 'suite', 'startup' ],
+            help =  'the benchmarks to run' )
+
+    parser.add_argument( '-i', '--input', type = str, default = './samples',
+            help =  'the image or directory with images to be benchmarked' )
+
+    parser.add_argument( '--downscale', type = int, default = 3,
+            help =  'the factor to downsize images by, as generation runs after pixelization' )
+
+    parser.add_argument( '--output_width_factor', type = float, default = 4,
+            help =  'the scale factor to determine the width of generated images' )
+
+    parser.add_argument( '--patch_factor', type = int, default = 8,
+            help = 'the factor to determine size of patches used during generation' )
+
+    parser.add_argument( '--blends', type = int, default = 8,
+            help = 'the number of blends to partly fill the canvas before comparing costs' )
+
+    parser.add_argument( '--n_colors', type = int, default = 8,
+            help =  'the number of palette colours to extract' )
+
+    parser.add_argument( '--palette_sample', type = int, default = 20000,
+            help =  'the number of sampled pixels for the fast palette extraction' )
+
+    # pipeline suite
+    parser.add_argument( '--synthetic_sizes', type = int, nargs = '*', default = [ 96 ],
+            help =  'the heights of synthetic square inputs added to the suite' )
+
+    parser.add_argument( '--modes', type = int, nargs = '+', default = [ 1, 2, 3, 4 ], choices = [ 1, 2, 3, 4 ],
+            help =  'the generation modes swept by the suite' )
+
+    parser.add_argument( '--directions', type = int, nargs = '+', default = [ 0, 1 ], choices = [ 0, 1 ],
+            help =  'the generation directions swept by the suite' )
+
+    parser.add_argument( '--patch_factors', type = int, nargs = '+', default = [ 8 ],
+            help =  'the patch factors swept by the suite' )
+
+    parser.add_argument( '--superpixel_sizes', type = int, nargs = '+', default = [ 3 ],
+            help =  'the superpixel sizes swept by the suite' )
+
+    parser.add_argument( '--width_factors', type = float, nargs = '+', default = [ 2, 4 ],
+            help =  'the output width factors swept by the suite' )
+
+    parser.add_argument( '--json', type = str,
+            help =  'the file to write the suite results to' )
+
+    parser.add_argument( '--baseline', type = str,
+            help =  'the suite results of an earlier run to compare against' )
+
+    parser.add_argument( '--tolerance', type = float, default = 0.2,
+            help =  'the relative slowdown or memory growth over the baseline counted as a regression' )
+
+    # startup
+    parser.add_argument( '--startup_budget', type = float, default = 0.5,
+            help =  'the time in seconds allowed to start a python process importing the pipeline' )
+
+    return parser.parse_args()
+
+
+# partly filled canvas and the pattern a generation mode searches placements for
+def getPartialGraph( image, mode, patchFactor, widthFactor, blends, seed = 0 ):
+    image = image.astype( np.int32 )
+    height, width, channels = image.shape
+    subPatchSize = ( height, width // patchFactor )
+    patchSize = image.shape[ : 2 ] if mode is GenMethod.GLOBAL_ROW else subPatchSize
+
+    g = Graph( height, int( width * widthFactor ), channels, rng = seed )
+    g.init_graph( image, new_pattern_size = patchSize )
+    for _ in range( blends ):
+        g.blend( g.match_patch( image, mode = 'opt_sub', k = 1, new_pattern_size = subPatchSize ) )
+
+    row = g.rng.integers( 0, height - patchSize[0] + 1 )
+    col = g.rng.integers( 0, width - patchSize[1] + 1 )
+    pattern = image[ row : row + patchSize[0], col : col + patchSize[1] ]
+
+    return g, pattern
+
+
+# time the costs of every placement from each backend, whose agreement tests/test_graph.py checks
+def timeCostMethods( g, pattern, repeats = 3 ):
+    rowRange = range( g.h - pattern.shape[0] + 1 )
+    colRange = range( g.w - pattern.shape[1] + 1 )
+
+    times = {}
+    for method in CostMethod:
+        g.cost_method = method
+        start = time.perf_counter()
+        for _ in range( repeats ):
+            g.placement_cost_fn( pattern, rowRange, colRange )
+        times[ method ] = ( time.perf_counter() - start ) / repeats
+
+    return times
+
+
+# time a whole generation with the given cost backend
+def timeGeneration( image, mode, patchFactor, widthFactor, costMethod, seed = 0 ):
+    start = time.perf_counter()
+    graphCut( image, GenDirection.HORIZONAL, patchFactor, mode, image.shape[0],
+              int( image.shape[1] * widthFactor ), costMethod, seed )
+
+    return time.perf_counter() - start
+
+
+# time palette extraction and colour reduction, measuring quality as the mean squared colour error
+def timePalette( image, nColours, sampleSize, seed = 0 ):
+    start = time.perf_counter()
+    colours, pixelMap = getPalette( image, nColours, seed, sampleSize )
+    result = reduceColour( image, colours, pixelMap )
+    elapsed = time.perf_counter() - start
+
+    error = np.square( result.astype( np.float64 ) - image ).sum( axis = 2 ).mean()
+
+    return elapsed, error
+
+
+# deterministic input with structure at several scales, as photographs have
+def getSyntheticImage( height, width, seed = 0 ):
+    rng = np.random.default_rng( seed )
+    image = np.zeros( ( height, width, 3 ), np.float64 )
+    for scale in ( 4, 16, 64 ):
+        noise = rng.random( ( max( 2, height // scale ), max( 2, width // scale ), 3 ) )
+        image += cv2.resize( noise, ( width, height ), interpolation = cv2.INTER_CUBIC )
+
+    image = 255 * ( image - image.min() ) / ( image.max() - image.min() )
+    alpha = np.full( ( height, width, 1 ), 255 )
+
+    return np.concatenate( [ image, alpha ], axis = 2 ).astype( np.uint8 )
+
+
+# peak resident memory of this process in MB, None where it cannot be measured
+def getPeakMemory():
+    if resource is None:
+        return None
+
+    peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+
+    # reported in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+# run the pipeline once on an image path or synthetic ( height, width ), timing each stage;
+# runs in a fresh process so that its peak memory is its own
+def runCase( source, direction, mode, patchFactor, superpixelSize, widthFactor, nColours ):
+    custom_io.STATUS_OUT = False
+    # scikit-learn is only imported by the first palette extraction, which in a fresh process
+    # would time the import rather than the pixelization, so it is loaded before any timer starts
+    import sklearn.cluster
+    wallStart = time.perf_counter()
+    if isinstance( source, str ):
+        im = cv2.imread( source, cv2.IMREAD_UNCHANGED )
+    else:
+        im = getSyntheticImage( *source )
+    startMemory = getPeakMemory()
+    stages = {}
+
+    start = time.perf_counter()
+    result = pixelizeP1( im, nColours, False, superpixelSize, 0 )
+    stages[ 'pixelize' ] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    outputWidth = int( im.shape[1] * widthFactor )
+    result = graphCut( result, GenDirection( direction ), patchFactor, GenMethod( mode ),
+                       im.shape[0] // superpixelSize, outputWidth // superpixelSize, seed = 0 )
+    stages[ 'generate' ] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pixelizeP2( result, outputWidth, im.shape[0] )
+    stages[ 'upscale' ] = time.perf_counter() - start
+
+    return { 'wall': time.perf_counter() - wallStart, 'stages': stages,
+             'start_memory_mb': startMemory, 'peak_memory_mb': getPeakMemory() }
+
+
+# run every combination of the swept parameters on every input
+def runSuite( args ):
+    sources = [ ( sp, p ) for p, sp in getImagePaths( args.input ) ]
+    sources += [ ( f'synthetic-{ size }', ( size, size ) ) for size in args.synthetic_sizes ]
+
+    results = []
+    context = multiprocessing.get_context( 'spawn' )
+    for name, source in sources:
+        for direction in args.directions:
+            for mode in args.modes:
+                for patchFactor in args.patch_factors:
+                    for superpixelSize in args.superpixel_sizes:
+                        for widthFactor in args.width_factors:
+                            params = { 'input': name, 'direction': direction, 'mode': mode,
+                                       'patch_factor': patchFactor, 'superpixel_size': superpixelSize,
+                                       'width_factor': widthFactor }
+                            with ProcessPoolExecutor( 1, context ) as executor:
+                                case = executor.submit( runCase, source, direction, mode, patchFactor,
+                                                        superpixelSize, widthFactor, args.n_colors ).result()
+                            results.append( { 'name': caseName( params ), 'params': params, **case } )
+
+                            print( f'{ results[-1][ "name" ] }: { case[ "wall" ]:.2f}s ' +
+                                   ' '.join( f'{ s } { case[ "stages" ][ s ]:.2f}s' for s in STAGES ) +
+                                   ( f', peak { case[ "peak_memory_mb" ]:.0f}MB' if case[ 'peak_memory_mb' ] else '' ) )
+
+    return results
+
+
+# identifier of a suite case, matching it across runs
+def caseName( params ):
+    return ( f'{ params[ "input" ] } direction { params[ "direction" ] } mode { params[ "mode" ] } ' +
+             f'patch { params[ "patch_factor" ] } superpixel { params[ "superpixel_size" ] } ' +
+             f'width { params[ "width_factor" ]:g}' )
+
+
+# cases slower or larger than the baseline beyond the tolerance and the noise floor
+def compareResults( results, baseline, tolerance ):
+    baselineCases = { case[ 'name' ]: case for case in baseline[ 'cases' ] }
+    regressions = []
+
+    for case in results:
+        old = baselineCases.get( case[ 'name' ] )
+        if old is None:
+            continue
+
+        for metric in ( 'wall', 'peak_memory_mb' ):
+            if case[ metric ] is None or old[ metric ] is None:
+                continue
+            ratio = case[ metric ] / max( old[ metric ], 1e-9 )
+            print( f'{ case[ "name" ] } { metric }: { old[ metric ]:.2f} -> { case[ metric ]:.2f} ({ ratio:.2f}x)' )
+            if ratio > 1 + tolerance and case[ metric ] - old[ metric ] > NOISE_FLOOR[ metric ]:
+                regressions.append( ( case[ 'name' ], metric, ratio ) )
+
+    return regressions
+
+
+# time starting fresh interpreters that import the pipeline, returning the fastest time
+# and the modules of optional features they loaded
+def timeStartup( repeats = STARTUP_REPEATS ):
+    script = 'import sys, generate; print( " ".join( sys.modules ) )'
+    directory = os.path.dirname( os.path.abspath( __file__ ) )
+
+    times = []
+    for _ in range( repeats ):
+        start = time.perf_counter()
+        output = subprocess.run( [ sys.executable, '-c', script ], cwd = directory,
+                                 capture_output = True, text = True, check = True ).stdout
+        times.append( time.perf_counter() - start )
+
+    loaded = set( output.split() )
+    return min( times ), [ module for module in LAZY_MODULES if module in loaded ]
+
+
+# main execution
+def main():
+    args = getArguments()
+    failed = False
+
+    if 'startup' in args.benchmarks:
+        startupTime, loaded = timeStartup()
+        print( f'startup: { startupTime:.2f}s (budget { args.startup_budget:.2f}s)' )
+        for module in loaded:
+            print( f'startup loaded { module }, which should only be imported when used' )
+        failed = failed or startupTime > args.startup_budget or len( loaded ) > 0
+
+    if 'suite' in args.benchmarks:
+        results = runSuite( args )
+
+        if args.json is not None:
+            environment = { 'python': platform.python_version(), 'numpy': np.__version__,
+                            'opencv': cv2.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count() }
+            with open( args.json, 'w' ) as f:
+                json.dump( { 'environment': environment, 'cases': results }, f, indent = 4 )
+
+        if args.baseline is not None:
+            with open( args.baseline ) as f:
+                regressions = compareResults( results, json.load( f ), args.tolerance )
+            for name, metric, ratio in regressions:
+                print( f'regression in { name }: { metric } { ratio:.2f}x the baseline' )
+            failed = failed or len( regressions ) > 0
+
+    # the other benchmarks run image by image
+    images = getImages( args.input ) if { 'cost', 'palette' } & set( args.benchmarks ) else []
+    for im, sp in images:
+        # palette extraction runs on the full resolution image
+        if 'palette' in args.benchmarks:
+            fullTime, fullError = timePalette( im, args.n_colors, None )
+            fastTime, fastError = timePalette( im, args.n_colors, args.palette_sample )
+
+            print( f'{ sp } { im.shape[1] }x{ im.shape[0] } palette: ' +
+                   f'time { fullTime:.2f}s -> { fastTime:.2f}s, ' +
+                   f'colour error { fullError:.1f} -> { fastError:.1f}' )
+
+        if 'cost' not in args.benchmarks:
+            continue
+
+        im = cv2.resize( im, ( im.shape[1] // args.downscale, im.shape[0] // args.downscale ),
+                         interpolation = cv2.INTER_LINEAR )
+
+        for mode in GenMethod:
+            g, pattern = getPartialGraph( im, mode, args.patch_factor, args.output_width_factor, args.blends )
+            times = timeCostMethods( g, pattern )
+
+            generationTimes = [ timeGeneration( im, mode, args.patch_factor, args.output_width_factor, method )
+                                for method in CostMethod ]
+
+            print( f'\n{ sp } { im.shape[1] }x{ im.shape[0] } { mode.name }: ' +
+                   f'cost { times[ CostMethod.FILTER_2D ] * 1000:.1f}ms -> ' +
+                   f'{ times[ CostMethod.MATCH_TEMPLATE ] * 1000:.1f}ms, ' +
+                   f'generation { generationTimes[0]:.2f}s -> { generationTimes[1]:.2f}s' )
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit( main() )
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+from contextlib import contextmanager
+
+# the manifest of a FileCache is only compacted where the fcntl module can lock it
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+#---------- constants ----------#
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+#---------- functions ----------#
+
+
+# key of an image's pixels together with the parameters of whatever is computed from it
+def contentKey( image, *params ):
+    digest = hashlib.blake2b( digest_size = 20 )
+    digest.update( repr( ( image.shape, image.dtype.str ) + params ).encode() )
+    digest.update( np.ascontiguousarray( image ).data )
+
+    return digest.hexdigest()
+
+
+# stable representation of an int seed or of the current state of a numpy Generator
+def seedKey( seed ):
+    if isinstance( seed, np.random.Generator ):
+        state = json.dumps( seed.bit_generator.state, sort_keys = True, default = str )
+        return hashlib.blake2b( state.encode(), digest_size = 16 ).hexdigest()
+
+    return seed
+
+
+#---------- classes ----------#
+
+
+# directory of arrays keyed by content, evicting the least recently used entries
+# once their total size passes maxBytes
+class DiskCache:
+    extension = '.npz'
+
+    def __init__( self, directory, maxBytes = DEFAULT_MAX_BYTES ):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        os.makedirs( directory, exist_ok = True )
+
+    def path( self, key ):
+        return os.path.join( self.directory, f'{ key }{ self.extension }' )
+
+    # arrays saved under the key, or None if there are none
+    def load( self, key ):
+        path = self.path( key )
+        try:
+            with np.load( path ) as entry:
+                arrays = { name: entry[ name ] for name in entry.files }
+
+        # entries may be evicted by another process at any time
+        except ( FileNotFoundError, OSError, ValueError ):
+            return None
+
+        # mark as recently used
+        try:
+            os.utime( path )
+        except FileNotFoundError:
+            pass
+
+        return arrays
+
+    def save( self, key, **arrays ):
+        # write to a temporary file first so that readers never see a partial entry
+        path = self.path( key )
+        temporaryPath = f'{ path }.{ os.getpid() }.tmp'
+        with open( temporaryPath, 'wb' ) as f:
+            np.savez_compressed( f, **arrays )
+        os.replace( temporaryPath, path )
+
+        self.evict()
+
+    def evict( self ):
+        entries = []
+        for name in os.listdir( self.directory ):
+            if not name.endswith( self.extension ):
+                continue
+            try:
+                stat = os.stat( os.path.join( self.directory, name ) )
+            except FileNotFoundError:
+                continue
+            entries.append( ( stat.st_mtime, stat.st_size, name ) )
+
+        # remove least recently used entries first
+        totalBytes = sum( size for _, size, _ in entries )
+        for _, size, name in sorted( entries ):
+            if totalBytes <= self.maxBytes:
+                break
+            try:
+                os.remove( os.path.join( self.directory, name ) )
+            except FileNotFoundError:
+                pass
+            totalBytes -= size
+
+
+# directory of files keyed by content, such as finished results, with a manifest of
+# what each entry was made from, evicting the least recently used entries as DiskCache does
+# and dropping their lines from the manifest
+class FileCache( DiskCache ):
+    extension = '.entry'
+
+    def manifestPath( self ):
+        return os.path.join( self.directory, 'manifest.jsonl' )
+
+    # hold the lock of the manifest, shared by the processes using the cache; the manifest itself
+    # is replaced when compacted, so a file of its own is locked
+    @contextmanager
+    def manifestLock( self ):
+        with open( os.path.join( self.directory, 'manifest.lock' ), 'a' ) as f:
+            if fcntl is not None:
+                fcntl.flock( f, fcntl.LOCK_EX )
+            yield
+
+    # link or copy the file saved under the key to a path, returning whether there was one
+    def restore( self, key, path, link = False ):
+        entryPath = self.path( key )
+        temporaryPath = f'{ path }.{ os.getpid() }.tmp'
+        try:
+            if link:
+                try:
+                    os.link( entryPath, temporaryPath )
+                except FileNotFoundError:
+                    raise
+                # fall back to a copy where links are not possible, such as across file systems
+                except OSError:
+                    shutil.copyfile( entryPath, temporaryPath )
+            else:
+                shutil.copyfile( entryPath, temporaryPath )
+
+        # entries may be evicted by another process at any time
+        except FileNotFoundError:
+            return False
+
+        os.replace( temporaryPath, path )
+
+        # mark as recently used
+        try:
+            os.utime( entryPath )
+        except FileNotFoundError:
+            pass
+
+        return True
+
+    # save a copy of a file under the key, recording what it was made from in the manifest
+    def save( self, key, path, **info ):
+        entryPath = self.path( key )
+        temporaryPath = f'{ entryPath }.{ os.getpid() }.tmp'
+        shutil.copyfile( path, temporaryPath )
+        os.replace( temporaryPath, entryPath )
+
+        line = json.dumps( dict( key = key, time = time.time(), **info ), default = str )
+        with self.manifestLock(), open( self.manifestPath(), 'a' ) as f:
+            f.write( line + '\n' )
+
+        self.evict()
+
+    def evict( self ):
+        super().evict()
+        if fcntl is None:
+            return
+
+        # rewrite the manifest with the lines of the files still in the cache, under its lock
+        # so that no line appended by another process meanwhile is lost
+        with self.manifestLock():
+            lines = self.manifestLines()
+            entries = self.manifest( lines )
+            if len( entries ) == len( lines ):
+                return
+
+            temporaryPath = f'{ self.manifestPath() }.{ os.getpid() }.tmp'
+            with open( temporaryPath, 'w' ) as f:
+                for entry in entries:
+                    f.write( json.dumps( entry, default = str ) + '\n' )
+            os.replace( temporaryPath, self.manifestPath() )
+
+    # every line of the manifest, including those of files evicted since it was last compacted
+    def manifestLines( self ):
+        try:
+            with open( self.manifestPath() ) as f:
+                return [ json.loads( line ) for line in f if line.strip() ]
+        except FileNotFoundError:
+            return []
+
+    # latest manifest entry of each file still in the cache, from the given lines of the manifest
+    # or from those read from it
+    def manifest( self, lines = None ):
+        if lines is None:
+            lines = self.manifestLines()
+
+        entries = { line[ 'key' ]: line for line in lines }
+        return [ entry for key, entry in entries.items() if os.path.exists( self.path( key ) ) ]
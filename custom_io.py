@@ -1,15 +1,16 @@
 # Used and modified with permission from https://github.com/THU17cyz/GraphCut
-import imageio
 import cv2
 import numpy as np
 from sys import stdout
 
 DEBUG_OUT = False
+STATUS_OUT = True
 
 def read_img(im_fn):
     im = cv2.imread(im_fn)
     if im is None:
         # print('{} cv2.imread failed'.format(im_fn))
+        import imageio
         tmp = imageio.mimread(im_fn)
         if tmp is not None:
             imt = np.array(tmp)
@@ -25,9 +26,16 @@ def write_img(im, fn):
     cv2.imwrite(fn, im.astype(np.uint8))
 
 def increment_status_message(current, max):
+    if not STATUS_OUT:
+        return
     stdout.write('\r')
     stdout.write("Generation Progress: %i%%" % (current/max*100))
 
+def end_status_line():
+    if not STATUS_OUT:
+        return
+    stdout.write('\n')
+
 def debug_out(string, *argv):
     if DEBUG_OUT:
         stdout.write(string % argv)
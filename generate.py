@@ -2,11 +2,25 @@ import os
 import sys
 import cv2
 import glob
+import json
+import zlib
+import queue
 import argparse
+import tempfile
+import threading
+import time
+import multiprocessing
+import numpy as np
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from tqdm import tqdm
+import custom_io
+from cache import DiskCache, FileCache, contentKey, seedKey
 from graphCut import graphCut
-from graphEnums import GenDirection, GenMethod
-from pixelization import pixelize, pixelizeP1, pixelizeP2
+from graphEnums import GenDirection, GenMethod, CostMethod
+from pixelization import getPalette, loadPaletteMap, nearestIndices, pixelize, pixelizeP1, pixelizeP2
+from profiling import NO_PROFILE, Profile
 
 
 #---------- constants ----------#
@@ -14,15 +28,270 @@ from pixelization import pixelize, pixelizeP1, pixelizeP2
 
 VALID_EXTENSIONS = [ 'png', 'jpg', 'jpeg' ]
 
+# number of images decoded ahead or waiting to be encoded, per worker
+PIPELINE_DEPTH = 2
+
+# number of pixels each image contributes to a shared palette by default
+SHARED_PALETTE_SAMPLE = 20000
+
+# seconds between looks at an empty spool directory when serving
+SPOOL_POLL_INTERVAL = 0.2
+
+# options that the jobs of a server cannot set
+SERVER_OPTIONS = [ 'serve', 'workers' ]
+
+# pipeline of a worker process, set up by initWorker
+workerPipeline = None
+
+# arguments that results depend on, besides the palettes, the image and its subpath,
+# and the width and variant of the output; streaming is left out as it gives the same results,
+# with any search scale, which tests/test_generate.py checks
+RESULT_ARGUMENTS = [ 'output_width_factor', 'output_height_factor', 'output_height',
+                     'n_colors', 'palette_sample', 'superpixel_size', 'pixelization_only', 'generation_only',
+                     'direction', 'patch_factor', 'generation_mode', 'cost_method', 'search_scale', 'tileable',
+                     'seed' ]
+
+# version of the results, to be raised whenever the same arguments give different results,
+# so that results cached before are not used
+RESULT_VERSION = 3
+
+# stages of the pipeline that can be resumed from, in order
+STAGES = [ 'pixelize', 'generate' ]
+
+# environment variables limiting the threads of numpy's BLAS backends
+THREAD_LIMIT_VARIABLES = [ 'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                           'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS' ]
+
+
+#---------- classes ----------#
+
+
+# parser raising its errors instead of exiting, to reject the options of a single job
+class JobArgumentParser( argparse.ArgumentParser ):
+    def error( self, message ):
+        raise ValueError( message )
+
+
+# processing of images with one set of arguments, kept to be reused for any number of them,
+# mapping them to the given palette instead of extracting their own if there is one
+class Pipeline:
+    def __init__( self, args, palette = None ):
+        self.args = args
+        self.palette = palette
+        self.paletteCache = getPaletteCache( args )
+        self.outputCache = getOutputCache( args )
+        self.stageCache = getStageCache( args )
+
+    # outputs of an image as ( subpath, width, variant, key of the cached result ), one per output width
+    # and variant, named after the image with the width and variant appended when there are several
+    def getOutputs( self, sp ):
+        widths = self.args.output_width or [ None ]
+        name, extension = os.path.splitext( sp )
+
+        outputs = []
+        for width in widths:
+            for variant in range( self.args.variants ):
+                suffix = ( f'_w{ width }' if len( widths ) > 1 else '' ) + \
+                         ( f'_v{ variant }' if self.args.variants > 1 else '' )
+                outputs.append( ( name + suffix + extension, width, variant, None ) )
+
+        return outputs
+
+    # pixelize and/or generate the given outputs of one image according to the arguments,
+    # returning their results in the same order; pixelization is done once for all of them
+    def processImage( self, im, sp, outputs = None, profile = NO_PROFILE ):
+        args, palette, paletteCache = self.args, self.palette, self.paletteCache
+        outputs = self.getOutputs( sp ) if outputs is None else outputs
+        pixelizationRng, generationSeeds = getImageRandomStreams( args.seed, sp, args.variants )
+
+        # pixelization only
+        if args.pixelization_only:
+            with profile.stage( 'pixelize' ):
+                result = pixelize( im, args.n_colors, args.recolor, args.superpixel_size, pixelizationRng,
+                                   args.palette_sample, paletteCache, palette, args.palette_map, profile )
+            return [ result ]
+
+        # pixelize image (part 1)
+        pixelized = None
+        if not args.generation_only:
+            with profile.stage( 'pixelize' ):
+                pixelized = self.pixelizeStage( im, pixelizationRng, profile )
+
+        # every output gets a random stream of its own, shared by the widths of a variant
+        def generate( output ):
+            _, width, variant, _ = output
+            return self.generateImage( im, pixelized, width, np.random.default_rng( generationSeeds[ variant ] ),
+                                       profile )
+
+        if args.variant_threads > 1 and len( outputs ) > 1:
+            with ThreadPoolExecutor( args.variant_threads ) as executor:
+                return list( executor.map( generate, outputs ) )
+
+        return [ generate( output ) for output in outputs ]
+
+    # generate one output of an image, from its pixelized version unless generating only
+    def generateImage( self, im, pixelized, width, generationRng, profile = NO_PROFILE ):
+        args = self.args
+
+        # generation only, writing finished columns out as they are done
+        if args.generation_only and args.stream:
+            outputSize = getOutputSize( im, args, False, width )
+            with profile.stage( 'generate' ):
+                result = generateStreamed( im, outputSize, outputSize, args, generationRng, profile )
+
+        # generation only
+        elif args.generation_only:
+            outputWidth, outputHeight = getOutputSize( im, args, False, width )
+            with profile.stage( 'generate' ):
+                result = graphCut( im, GenDirection( args.direction ), args.patch_factor,
+                                    GenMethod( args.generation_mode ), outputHeight, outputWidth,
+                                    CostMethod( args.cost_method ), generationRng, None, args.search_scale,
+                                    args.tileable, profile )
+
+        # texture generation and pixelize image (part 2) on columns as soon as they are finished
+        elif args.stream:
+            with profile.stage( 'generate' ):
+                result = generateStreamed( pixelized, getOutputSize( im, args, True, width ),
+                                           getOutputSize( im, args, False, width ), args, generationRng, profile )
+
+        else:
+            # texture generation
+            outputWidth, outputHeight = getOutputSize( im, args, True, width )
+            with profile.stage( 'generate' ):
+                result = graphCut( pixelized, GenDirection( args.direction ), args.patch_factor,
+                                    GenMethod( args.generation_mode ), outputHeight, outputWidth,
+                                    CostMethod( args.cost_method ), generationRng, None, args.search_scale,
+                                    args.tileable, profile )
+
+            # pixelize image (part 2)
+            outputWidth, outputHeight = getOutputSize( im, args, False, width )
+            with profile.stage( 'upscale' ):
+                result = pixelizeP2( result, outputWidth, outputHeight )
+
+        return result
+
+    # pixelize image (part 1), or load it from the stage cache if it was pixelized with
+    # the same arguments before and not starting from the pixelization stage
+    def pixelizeStage( self, im, rng, profile = NO_PROFILE ):
+        args = self.args
+
+        # colours picked interactively are never the same
+        if self.stageCache is None or args.recolor:
+            return pixelizeP1( im, args.n_colors, args.recolor, args.superpixel_size, rng,
+                               args.palette_sample, self.paletteCache, self.palette, args.palette_map, profile )
+
+        # keyed by the state of the random stream before it is used
+        key = contentKey( im, 'pixelizeP1', args.n_colors, args.palette_sample, args.superpixel_size,
+                          seedKey( rng ), *self.getPaletteParams() )
+        if args.from_stage != 'pixelize':
+            entry = self.stageCache.load( key )
+            if entry is not None:
+                profile.count( 'stage_cache_hits' )
+                return entry[ 'image' ]
+        if args.from_stage == 'generate':
+            raise LookupError( 'no cached pixelized image to start generation from' )
+
+        result = pixelizeP1( im, args.n_colors, args.recolor, args.superpixel_size, rng,
+                             args.palette_sample, self.paletteCache, self.palette, args.palette_map, profile )
+        self.stageCache.save( key, image = result )
+
+        return result
+
+    # shared palette and palette map as plain lists, to key results with
+    def getPaletteParams( self ):
+        palette = None if self.palette is None else self.palette.tolist()
+        paletteMap = None if self.args.palette_map is None else \
+            { name: colours.tolist() for name, colours in self.args.palette_map.items() }
+
+        return palette, paletteMap
+
+    # outputs of an image file with the keys of their cached results, keyed by everything they depend on
+    # besides the other outputs, so that adding widths or variants keeps those cached before
+    def getResultKeys( self, path, sp, outputs ):
+        # results of unseeded or interactive runs are never the same
+        if self.outputCache is None or self.args.seed is None or self.args.recolor:
+            return outputs
+
+        params = { name: getattr( self.args, name ) for name in RESULT_ARGUMENTS }
+
+        # the file is hashed as it is, so that cached results are found without decoding it
+        data = np.fromfile( path, np.uint8 )
+        return [ ( outputSp, width, variant,
+                   contentKey( data, 'result', RESULT_VERSION, sp.replace( os.sep, '/' ), width, variant,
+                               sorted( params.items() ), *self.getPaletteParams() ) )
+                 for outputSp, width, variant, _ in outputs ]
+
+    # read an image to process along with its profile and its outputs still to be made, or None if all
+    # of them were restored from the cache instead; the image is None if it cannot be decoded,
+    # while errors reading the file, such as a missing file or denied permission, are raised
+    def readImageFile( self, path, sp ):
+        outputs = self.getResultKeys( path, sp, self.getOutputs( sp ) )
+
+        if not self.args.force:
+            outputs = [ output for output in outputs if not self.restoreResult( output ) ]
+            if not outputs:
+                return None
+
+        profile = Profile() if self.args.profile else NO_PROFILE
+        with profile.stage( 'read' ):
+            im = cv2.imread( path, cv2.IMREAD_UNCHANGED )
+
+        return im, profile, outputs
+
+    # link or copy the cached result of an output into the output directory, returning whether there was one
+    def restoreResult( self, output ):
+        outputSp, _, _, key = output
+        if key is None:
+            return False
+
+        outputPath = os.path.join( self.args.output_dir, outputSp )
+        os.makedirs( os.path.dirname( outputPath ), exist_ok = True )
+        return self.outputCache.restore( key, outputPath, self.args.output_cache_link )
+
+    # save the results of an image into the output directory, and into the cache under their keys if they
+    # have any, along with the report of its profile if it was profiled
+    def saveResults( self, results, sp, outputs, profile = NO_PROFILE ):
+        for result, ( outputSp, width, variant, key ) in zip( results, outputs ):
+            saveImage( result, outputSp, self.args.output_dir, profile )
+
+            if key is not None:
+                arguments = { name: getattr( self.args, name ) for name in RESULT_ARGUMENTS }
+                self.outputCache.save( key, os.path.join( self.args.output_dir, outputSp ), image = outputSp,
+                                       arguments = dict( arguments, output_width = width, variant = variant ) )
+
+        if profile is not NO_PROFILE:
+            report = dict( image = sp, outputs = { output[0]: list( result.shape )
+                                                   for result, output in zip( results, outputs ) } )
+            with open( os.path.join( self.args.output_dir, f'{ sp }.profile.json' ), 'w' ) as f:
+                json.dump( dict( report, **profile.report() ), f, indent = 4 )
+
+    # read, process and save one image, returning its subpath and the error if it failed
+    def processImageFile( self, path, sp ):
+        try:
+            image = self.readImageFile( path, sp )
+            if image is None:
+                return sp, None
+
+            im, profile, outputs = image
+            if im is None:
+                return sp, f'{ path } does not exist'
+
+            self.saveResults( self.processImage( im, sp, outputs, profile ), sp, outputs, profile )
+            return sp, None
+
+        except Exception as e:
+            return sp, f'{ type( e ).__name__ }: { e }'
+
 
 #---------- functions ----------#
 
 
-# construct arguments for the pipeline
-def getArguments():
-    parser = argparse.ArgumentParser( description = 'Generate parallax background' )
+# construct arguments for the pipeline from the command line or the given arguments,
+# with the given parser class and defaults
+def getArguments( argv = None, parserClass = argparse.ArgumentParser, defaults = None ):
+    parser = parserClass( description = 'Generate parallax background' )
 
-    parser.add_argument( '-i', '--input', type = str, required = True,
+    parser.add_argument( '-i', '--input', type = str,
             help =  'the image or directory with images to be used (this is a required argument)' )
 
     parser.add_argument( '-o', '--output_dir', type = str, default = './output',
@@ -34,8 +303,9 @@ def getArguments():
     parser.add_argument( '--output_height_factor', type = float, default = 1,
             help =  'the scale factor to determine the height of resulting image' )
     
-    parser.add_argument( '--output_width', type = int,
-            help =  'the width of resulting image (setting this will ignore \'output_width_factor\')' )
+    parser.add_argument( '--output_width', type = int, nargs = '+',
+            help =  'the width of resulting image, or several widths to make an image of each ' +
+                    '(setting this will ignore \'output_width_factor\')' )
     
     parser.add_argument( '--output_height', type = int,
             help =  'the height of resulting image (setting this will ignore \'output_height_factor\')' )
@@ -43,8 +313,24 @@ def getArguments():
     parser.add_argument( '--n_colors', type = int, default = 8,
             help =  'the number of dominate colours to be extracted as a palette for the image(s)' )
 
+    parser.add_argument( '--palette_sample', type = int,
+            help =  'the number of randomly sampled pixels to extract the palette from (all pixels if not set)' )
+
+    parser.add_argument( '--palette_cache', type = str,
+            help =  'the directory to cache extracted palettes in, to skip clustering on repeated runs' )
+
+    parser.add_argument( '--palette_cache_size', type = int, default = 256,
+            help =  'the size limit of the palette cache in MB, least recently used palettes are evicted' )
+
+    parser.add_argument( '--shared_palette', action = 'store_true', default = False,
+            help =  'the option to extract one palette from all images and apply it to each of them, ' +
+                    'keeping the layers of a scene consistent' )
+
     parser.add_argument( '--recolor', action = 'store_true', default = False, 
             help =  'the option to turn on palette recolouring for the image(s)' )
+
+    parser.add_argument( '--palette_map', type = paletteMapArgument,
+            help =  'the JSON file of colour mappings to recolour palettes with, without any interaction' )
     
     parser.add_argument( '--superpixel_size', type = int, default = 3,
             help =  'the size of a \'pixel\' after pixelization' )
@@ -60,61 +346,201 @@ def getArguments():
     parser.add_argument( '--patch_factor', type = int, default = 8,
             help = 'the factor to determine size of patches used during generation' )
     
-    parser.add_argument( '--generation_mode', type = int, default = 2, choices = [ 1, 2, 3 ],
+    parser.add_argument( '--generation_mode', type = int, default = 2, choices = [ 1, 2, 3, 4 ],
             help =  'the mode for texture generation; ' +
                     '1 for global subpatch best matching; ' + 
                     '2 for row-by-row subpatch best matching; ' +
-                    '3 for row-by-row best matching' )
+                    '3 for row-by-row best matching; ' +
+                    '4 for largest-hole-first subpatch best matching' )
+
+    parser.add_argument( '--cost_method', type = int, default = 1, choices = [ 1, 2 ],
+            help =  'the backend computing the matching cost of patch placements; ' +
+                    '1 for float64 filter2D correlations; ' +
+                    '2 for float32 masked template matching' )
+
+    parser.add_argument( '--search_scale', type = int, default = 1,
+            help =  'the block size of a coarse placement search refined around its best candidates; ' +
+                    '1 searches every placement, larger values are faster but may miss the best ones' )
+
+    parser.add_argument( '--tileable', action = 'store_true', default = False,
+            help =  'the option to generate outputs whose right edge continues into their left one, ' +
+                    'so that they loop seamlessly (horizontal generation only)' )
+
+    parser.add_argument( '--stream', action = 'store_true', default = False,
+            help =  'the option to keep only a window of the generated image in memory ' +
+                    'and write finished columns out as they are done (horizontal generation only)' )
 
     parser.add_argument( '--generation_only', action = 'store_true', default = False,
             help =  'the option to run only the Graphcut generation part' )
-    
-    return parser.parse_args()
 
+    parser.add_argument( '--variants', type = int, default = 1,
+            help =  'the number of different generations of each image, pixelized only once' )
 
-# get image from system argument
-def getImages( path ):
-    imagePaths = [];
-    imageSubpaths = [];
-    images = [];
+    parser.add_argument( '--variant_threads', type = int, default = 1,
+            help =  'the number of threads generating the variants and widths of an image at the same time' )
+
+    parser.add_argument( '--output_cache', type = str,
+            help =  'the directory to cache results in, to skip images whose result is already there ' +
+                    '(needs --seed)' )
+
+    parser.add_argument( '--output_cache_size', type = int, default = 1024,
+            help =  'the size limit of the output cache in MB, least recently used results are evicted' )
+
+    parser.add_argument( '--output_cache_link', action = 'store_true', default = False,
+            help =  'the option to hard link cached results into the output directory instead of copying them' )
+
+    parser.add_argument( '--force', action = 'store_true', default = False,
+            help =  'the option to process every image even if its result is cached' )
+
+    parser.add_argument( '--stage_cache', type = str,
+            help =  'the directory to cache pixelized images in, so that generation can start from them' )
+
+    parser.add_argument( '--stage_cache_size', type = int, default = 512,
+            help =  'the size limit of the stage cache in MB, least recently used images are evicted' )
+
+    parser.add_argument( '--from_stage', type = str, choices = STAGES,
+            help =  'the stage to start from; ' +
+                    'pixelize to rerun every stage; ' +
+                    'generate to start from cached pixelized images only ' +
+                    '(by default, from the latest stage that is cached)' )
+
+    parser.add_argument( '--seed', type = int,
+            help =  'the seed for reproducible results (each image gets its own random stream)' )
+
+    parser.add_argument( '--workers', type = int, default = 1,
+            help =  'the number of worker processes to spread images across' )
+
+    parser.add_argument( '--profile', action = 'store_true', default = False,
+            help =  'the option to save a JSON report of the time spent in each stage next to each result' )
+
+    parser.add_argument( '--serve', type = str,
+            help =  'the spool directory to keep taking JSON jobs from, instead of processing the input once' )
+
+    if defaults is not None:
+        parser.set_defaults( **defaults )
+    args = parser.parse_args( argv )
+
+    if args.input is None and args.serve is None:
+        parser.error( 'the following arguments are required: -i/--input' )
+
+    if args.serve is not None and ( args.recolor or args.workers > 1 ):
+        parser.error( '--serve runs jobs one at a time without interaction, so without --recolor or --workers' )
+
+    if args.workers > 1 and args.recolor:
+        parser.error( 'the interactive --recolor cannot run in worker processes' )
+
+    if args.output_cache is not None and args.seed is None:
+        parser.error( '--output_cache needs --seed, as results differ from run to run without one' )
+
+    if args.from_stage == 'generate' and args.stage_cache is None:
+        parser.error( '--from_stage generate needs --stage_cache to start from' )
+
+    if args.variants < 1 or args.variant_threads < 1:
+        parser.error( '--variants and --variant_threads must be at least 1' )
+
+    if args.pixelization_only and ( args.variants > 1 or len( args.output_width or [] ) > 1 ):
+        parser.error( '--variants and several --output_width only apply to generation' )
+
+    if args.search_scale < 1:
+        parser.error( '--search_scale must be at least 1' )
+
+    if args.stream and ( args.direction != GenDirection.HORIZONAL.value or args.pixelization_only ):
+        parser.error( '--stream only applies to horizontal generation' )
+
+    if args.tileable and ( args.direction != GenDirection.HORIZONAL.value or args.pixelization_only or args.stream ):
+        parser.error( '--tileable only applies to horizontal generation without --stream' )
 
+    return args
+
+
+# parse a palette map file given as argument
+def paletteMapArgument( path ):
+    try:
+        return loadPaletteMap( path )
+    except OSError as e:
+        raise argparse.ArgumentTypeError( f'cannot read palette map: { e }' )
+    except ValueError as e:
+        raise argparse.ArgumentTypeError( f'invalid palette map { path }: { e }' )
+
+
+# get paths of all images from system argument lazily, along with their paths relative to it
+def getImagePaths( path ):
     # get all image paths
     if os.path.isdir( path ):
         # get all paths with valid extension
         for ext in VALID_EXTENSIONS:
-            imagePaths.extend( glob.glob( os.path.join( path, f'**/*.{ ext }' ), recursive = True ) )
-
-        # get all images and names from the path list
-        for p in imagePaths:
-            # read image from path
-            im = cv2.imread( p, cv2.IMREAD_UNCHANGED ) 
-
-            # if image does not exist, log and skip this image
-            if im is None:
-                print( f'{ p } does not exist' )
-
-            else:
-                images.append( im )
-                imageSubpaths.append( os.path.relpath( p, path ) )
+            for p in glob.iglob( os.path.join( path, f'**/*.{ ext }' ), recursive = True ):
+                yield p, os.path.relpath( p, path )
 
     # there is only one image inputed
     else:
-        im = cv2.imread( path, cv2.IMREAD_UNCHANGED )
+        yield path, os.path.basename( path )
+
+
+# get images from system argument lazily, reading each one only when it is reached
+def getImages( path ):
+    for p, sp in getImagePaths( path ):
+        # read image from path
+        im = cv2.imread( p, cv2.IMREAD_UNCHANGED ) 
 
         # if image does not exist, log and skip this image
         if im is None:
-            print( f'{ path } does not exist' )
+            print( f'{ p } does not exist' )
 
         else:
-            images.append( im )
-            imageSubpaths.append( os.path.basename( path ) )
+            yield im, sp
+
 
-    return images, imageSubpaths
+# get images to process lazily as ( sp, ( image, profile, outputs still to be made ), error ),
+# leaving out those whose results are all restored from the cache; an image that fails to be
+# read, decoded or restored comes with its error instead, as in Pipeline.processImageFile,
+# so that it fails the batch as it does with workers while the rest of the batch goes on
+def getPipelineImages( pipeline, path ):
+    for p, sp in getImagePaths( path ):
+        try:
+            image = pipeline.readImageFile( p, sp )
+        except Exception as e:
+            yield sp, None, f'{ type( e ).__name__ }: { e }'
+            continue
+
+        if image is None:
+            continue
+
+        if image[0] is None:
+            yield sp, None, f'{ p } does not exist'
+
+        else:
+            yield sp, image, None
 
 
-# determine output image width and height
-def getOutputSize( image, args, downsized = False ):
-    width, height = args.output_width, args.output_height
+# run a generator on a background thread, staying at most `depth` items ahead of the consumer
+def prefetch( items, depth = PIPELINE_DEPTH ):
+    buffer = queue.Queue( maxsize = depth )
+    end = object()
+
+    errors = []
+
+    # errors of the generator are raised to the consumer once the items before them are used
+    def produce():
+        try:
+            for item in items:
+                buffer.put( item )
+        except BaseException as e:
+            errors.append( e )
+        finally:
+            buffer.put( end )
+
+    threading.Thread( target = produce, daemon = True ).start()
+    while ( item := buffer.get() ) is not end:
+        yield item
+
+    if errors:
+        raise errors[0]
+
+
+# determine output image width and height, for the given width if there are several
+def getOutputSize( image, args, downsized = False, width = None ):
+    height = args.output_height
 
     if width is None:
         width = int( image.shape[1] * args.output_width_factor )
@@ -128,56 +554,335 @@ def getOutputSize( image, args, downsized = False ):
     return width, height
 
 
+# independent random streams of an image for pixelization and the seeds of those for the generation
+# of each variant, keyed by its path so that they do not depend on the order of the batch
+def getImageRandomStreams( seed, subpath, variants = 1 ):
+    if seed is None:
+        return None, [ None ] * variants
+
+    sequence = np.random.SeedSequence( [ seed, zlib.crc32( subpath.replace( os.sep, '/' ).encode() ) ] )
+    pixelizationSeed, generationSeed = sequence.spawn( 2 )
+
+    # the first variant is generated as without variants, and the others do not depend on how many there are
+    generationSeeds = [ generationSeed ] + generationSeed.spawn( variants - 1 )
+
+    return np.random.default_rng( pixelizationSeed ), generationSeeds
+
+
+# palette cache described by the arguments, if any
+def getPaletteCache( args ):
+    if args.palette_cache is None:
+        return None
+
+    return DiskCache( args.palette_cache, args.palette_cache_size * 1024 * 1024 )
+
+
+# cache of pixelized images described by the arguments, if any
+def getStageCache( args ):
+    if args.stage_cache is None:
+        return None
+
+    return DiskCache( args.stage_cache, args.stage_cache_size * 1024 * 1024 )
+
+
+# result cache described by the arguments, if any
+def getOutputCache( args ):
+    if args.output_cache is None:
+        return None
+
+    return FileCache( args.output_cache, args.output_cache_size * 1024 * 1024 )
+
+
+# extract one palette from pixels sampled evenly across all images, so that every image
+# weighs the same however large it is; images are visited in order of their paths and
+# sampled with their own random streams, keeping the palette independent of listing order
+def getSharedPalette( args ):
+    sampleSize = args.palette_sample or SHARED_PALETTE_SAMPLE
+    samples = []
+
+    for p, sp in sorted( getImagePaths( args.input ), key = lambda path: path[1] ):
+        im = cv2.imread( p, cv2.IMREAD_UNCHANGED )
+        if im is None:
+            continue
+
+        pixels = im.reshape( ( -1, im.shape[2] ) )
+        if samples and pixels.shape[1] != samples[0].shape[1]:
+            raise ValueError( f'{ sp } has { pixels.shape[1] } channels while other images have ' +
+                              f'{ samples[0].shape[1] }, so they cannot share a palette' )
+
+        rng = np.random.default_rng( getImageRandomStreams( args.seed, sp )[0] )
+        samples.append( pixels[ rng.choice( len( pixels ), min( sampleSize, len( pixels ) ), replace = False ) ] )
+
+    if not samples:
+        return None
+
+    # the pooled sample is clustered as a one column image
+    colours, _ = getPalette( np.concatenate( samples )[ :, None, : ], args.n_colors, args.seed,
+                             cache = getPaletteCache( args ) )
+
+    return colours
+
+
+# generate an image column by column, upscaling finished columns to the output size straight into
+# a temporary file that is removed once the result is released
+def generateStreamed( image, generationSize, outputSize, args, generationRng, profile = NO_PROFILE ):
+    ( generationWidth, generationHeight ), ( outputWidth, outputHeight ) = generationSize, outputSize
+    result = np.memmap( tempfile.TemporaryFile( dir = args.output_dir ), np.uint8, 'w+',
+                        shape = ( outputHeight, outputWidth, image.shape[2] ) )
+    rows = nearestIndices( generationHeight, outputHeight )
+    cols = nearestIndices( generationWidth, outputWidth )
+
+    def write( columns, col ):
+        # output columns whose source column is among the finished ones
+        start, stop = np.searchsorted( cols, [ col, col + columns.shape[1] ] )
+        result[ :, start : stop ] = columns[ rows ][ :, cols[ start : stop ] - col ]
+
+    graphCut( image, GenDirection( args.direction ), args.patch_factor, GenMethod( args.generation_mode ),
+              generationHeight, generationWidth, CostMethod( args.cost_method ), generationRng, write, args.search_scale,
+              False, profile )
+
+    return result
+
+
+# save a result image, creating subdirectories to match input directory structure if necessary
+def saveImage( result, sp, outputDir, profile = NO_PROFILE ):
+    saveDir = os.path.join( outputDir, os.path.dirname( sp ) )
+    if not os.path.exists( saveDir ):
+        os.makedirs( saveDir, exist_ok = True )
+
+    # write to a temporary file first and replace the old result with it, so that a result hard linked
+    # from the output cache is unlinked instead of written through, which would change the cached copy
+    path = os.path.join( outputDir, sp )
+    name, extension = os.path.splitext( path )
+    temporaryPath = f'{ name }.{ os.getpid() }.tmp{ extension }'
+    with profile.stage( 'write' ):
+        if not cv2.imwrite( temporaryPath, result ):
+            raise OSError( f'cannot write { path }' )
+        os.replace( temporaryPath, path )
+
+
+# process one image with the pipeline of the worker process
+def processInWorker( path, sp ):
+    return workerPipeline.processImageFile( path, sp )
+
+
+# keep each worker to its share of the cores, as numpy and opencv would each use all of them,
+# and set up the pipeline it processes its images with
+def initWorker( threads, args, palette ):
+    global workerPipeline
+    custom_io.STATUS_OUT = False
+    cv2.setNumThreads( threads )
+    workerPipeline = Pipeline( args, palette )
+
+
+# limit the threads of BLAS libraries in the processes started within, as they read their limits
+# from the environment when numpy is imported, restoring the environment of this process after
+@contextmanager
+def threadLimits( threads ):
+    saved = { var: os.environ.get( var ) for var in THREAD_LIMIT_VARIABLES }
+    os.environ.update( { var: str( threads ) for var in THREAD_LIMIT_VARIABLES } )
+    try:
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop( var, None )
+            else:
+                os.environ[ var ] = value
+
+
+# process images in a pool of worker processes, returning the failed ones
+def processInParallel( args, palette = None ):
+    threads = max( 1, ( os.cpu_count() or 1 ) // args.workers )
+    failures = []
+    progressBar = tqdm( desc = 'Generating pixelized background' )
+
+    def collect( done ):
+        for future in done:
+            sp, error = future.result()
+            if error is not None:
+                failures.append( ( sp, error ) )
+            progressBar.update()
+
+    # workers may be started at any time while the pool runs, so the limits last until it is shut down
+    context = multiprocessing.get_context( 'spawn' )
+    with threadLimits( threads ), \
+         ProcessPoolExecutor( args.workers, context, initWorker, ( threads, args, palette ) ) as executor:
+        # keep a bounded number of images in flight so that large input trees are never fully queued
+        pending = set()
+        for p, sp in getImagePaths( args.input ):
+            if len( pending ) >= PIPELINE_DEPTH * args.workers:
+                done, pending = wait( pending, return_when = FIRST_COMPLETED )
+                collect( done )
+            pending.add( executor.submit( processInWorker, p, sp ) )
+        collect( wait( pending ).done )
+
+    progressBar.close()
+    return failures
+
+
+# process images one by one, decoding the next and encoding the previous ones in the background
+def processInSequence( args, palette = None ):
+    pipeline = Pipeline( args, palette )
+    failures = []
+    saving = deque()
+
+    def collect( sp, future ):
+        try:
+            future.result()
+        except Exception as e:
+            failures.append( ( sp, f'{ type( e ).__name__ }: { e }' ) )
+
+    with ThreadPoolExecutor( 1 ) as encoder:
+        progressBar = tqdm( prefetch( getPipelineImages( pipeline, args.input ) ),
+                            desc = 'Generating pixelized background' )
+        for sp, image, error in progressBar:
+            if error is not None:
+                failures.append( ( sp, error ) )
+                continue
+
+            im, profile, outputs = image
+            try:
+                results = pipeline.processImage( im, sp, outputs, profile )
+            except Exception as e:
+                failures.append( ( sp, f'{ type( e ).__name__ }: { e }' ) )
+                continue
+
+            # wait for the oldest write once enough results are held in memory
+            if len( saving ) >= PIPELINE_DEPTH:
+                collect( *saving.popleft() )
+            saving.append( ( sp, encoder.submit( pipeline.saveResults, results, sp, outputs, profile ) ) )
+        progressBar.close()
+
+        while saving:
+            collect( *saving.popleft() )
+
+    return failures
+
+
+# arguments of a job, given as a dictionary of options named as on the command line,
+# overriding the arguments the server was started with
+def getJobArguments( options, serverArgs ):
+    unknown = [ name for name in options if name not in vars( serverArgs ) or name in SERVER_OPTIONS ]
+    if unknown:
+        raise ValueError( f'unknown job options { unknown }' )
+    if options.get( 'input' ) is None:
+        raise ValueError( 'the job has no input' )
+
+    # flags and unset options become defaults, the rest are parsed as on the command line
+    defaults, argv = dict( vars( serverArgs ) ), []
+    for name, value in options.items():
+        if isinstance( value, bool ) or value is None:
+            defaults[ name ] = value
+        elif isinstance( value, list ):
+            argv += [ f'--{ name }' ] + [ str( v ) for v in value ]
+        else:
+            argv += [ f'--{ name }', str( value ) ]
+
+    return getArguments( argv, JobArgumentParser, defaults )
+
+
+# write a JSON file through a temporary one, so that readers never see it partly written
+def writeJSON( path, content ):
+    temporaryPath = f'{ path }.{ os.getpid() }.tmp'
+    with open( temporaryPath, 'w' ) as f:
+        json.dump( content, f, indent = 4 )
+    os.replace( temporaryPath, path )
+
+
+# claim a job of the spool directory and run it, keeping its status in a file next to it;
+# jobs already claimed by another server are left to it
+def runJob( path, serverArgs ):
+    name = path[ : -len( '.json' ) ]
+    claimedPath, statusPath = f'{ path }.running', f'{ name }.status.json'
+    try:
+        os.rename( path, claimedPath )
+    except FileNotFoundError:
+        return
+
+    start = time.perf_counter()
+    status = { 'state': 'running', 'job': None, 'results': [], 'failures': [] }
+    try:
+        with open( claimedPath ) as f:
+            status[ 'job' ] = json.load( f )
+        writeJSON( statusPath, status )
+
+        args = getJobArguments( status[ 'job' ], serverArgs )
+        os.makedirs( args.output_dir, exist_ok = True )
+        palette = getSharedPalette( args ) if args.shared_palette and not args.generation_only else None
+        pipeline = Pipeline( args, palette )
+
+        for p, sp in getImagePaths( args.input ):
+            _, error = pipeline.processImageFile( p, sp )
+            if error is None:
+                status[ 'results' ] += [ os.path.join( args.output_dir, output[0] )
+                                         for output in pipeline.getOutputs( sp ) ]
+            else:
+                status[ 'failures' ].append( { 'image': sp, 'error': error } )
+        status[ 'state' ] = 'failed' if status[ 'failures' ] else 'done'
+
+    except Exception as e:
+        status[ 'state' ] = 'failed'
+        status[ 'error' ] = f'{ type( e ).__name__ }: { e }'
+
+    status[ 'seconds' ] = time.perf_counter() - start
+    writeJSON( statusPath, status )
+    os.remove( claimedPath )
+    print( f'\n{ os.path.basename( name ) } { status[ "state" ] } in { status[ "seconds" ]:.2f}s' )
+
+
+# keep running the jobs dropped into the spool directory in order of their names, until interrupted
+def serve( args ):
+    os.makedirs( args.serve, exist_ok = True )
+    print( f'Serving jobs from { args.serve }' )
+
+    while True:
+        jobs = sorted( p for p in glob.glob( os.path.join( glob.escape( args.serve ), '*.json' ) )
+                       if not p.endswith( '.status.json' ) )
+        for path in jobs:
+            runJob( path, args )
+
+        if not jobs:
+            time.sleep( SPOOL_POLL_INTERVAL )
+
+
 # main execution
 def main():
     # get input arguments
     args = getArguments()
 
-    # get all images
-    images, imageSubpaths = getImages( args.input )
+    # progress of generations running side by side would interleave, and a server only reports its jobs
+    if args.variant_threads > 1 or args.serve is not None:
+        custom_io.STATUS_OUT = False
+
+    # keep taking jobs instead
+    if args.serve is not None:
+        try:
+            serve( args )
+        except KeyboardInterrupt:
+            return 0
 
     # create output directory to save output images
     if not os.path.exists( args.output_dir ):
         os.makedirs( args.output_dir )
 
-    # pixelize images and save them to output directory
-    progressBar = tqdm( zip( images, imageSubpaths ), desc = 'Generating pixelized background', total = len( images ) )
-    for im, sp in progressBar:
-        # pixelization only
-        if args.pixelization_only:
-            result = pixelize( im, args.n_colors, args.recolor, args.superpixel_size )
-
-        # generation only
-        elif args.generation_only:
-            outputWidth, outputHeight = getOutputSize( im, args, downsized = False )
-            result = graphCut( im, GenDirection( args.direction ), args.patch_factor,
-                                GenMethod( args.generation_mode ), outputHeight, outputWidth )
-
-        # pixelization and generation
-        else:
-            # pixelize image (part 1)
-            result = pixelizeP1( im, args.n_colors, args.recolor, args.superpixel_size )
+    # extract the palette shared by all images in a first pass
+    palette = None
+    if args.shared_palette and not args.generation_only:
+        palette = getSharedPalette( args )
 
-            # texture generation
-            outputWidth, outputHeight = getOutputSize( im, args, downsized = True )
-            result = graphCut( result, GenDirection( args.direction ), args.patch_factor,
-                                GenMethod( args.generation_mode ), outputHeight, outputWidth )
+    # pixelize images and save them to output directory
+    if args.workers > 1:
+        failures = processInParallel( args, palette )
+    else:
+        failures = processInSequence( args, palette )
 
-            # pixelize image (part 2)
-            outputWidth, outputHeight = getOutputSize( im, args, downsized = False )
-            result = pixelizeP2( result, outputWidth, outputHeight )
-
-        # create subdirectories to match input directory structure if necessary
-        saveDir = os.path.join( args.output_dir, os.path.dirname( sp ) )
-        if not os.path.exists( saveDir ):
-            os.makedirs( saveDir )
-        
-        # save image
-        cv2.imwrite( os.path.join( args.output_dir, sp ), result )
-    progressBar.close()
+    # report failed images after the rest of the batch is done
+    for sp, error in failures:
+        print( f'{ sp } failed: { error }' )
 
-    return 
+    return 1 if failures else 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit( main() )
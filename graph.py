@@ -4,7 +4,8 @@ import cv2
 import numpy as np
 
 from custom_io import debug_out, show_img, write_img
-from viz import plot_graph_2d
+from graphEnums import CostMethod
+from profiling import NO_PROFILE
 
 CHANNELS_RGB = 3
 CHANNEL_SLICES = [
@@ -16,61 +17,251 @@ CHANNEL_SLICES = [
 
 INF = 1.0e8
 
+# placements of the coarse search refined at full resolution
+PYRAMID_CANDIDATES = 8
+
+# sums over the h x w box at every placement in range, read from a summed table
+def box_sum(table, row_range, col_range, h, w):
+    rows = slice(row_range[0], row_range[0]+len(row_range))
+    cols = slice(col_range[0], col_range[0]+len(col_range))
+    rows_end = slice(rows.start+h, rows.stop+h)
+    cols_end = slice(cols.start+w, cols.stop+w)
+    return table[rows, cols]+table[rows_end, cols_end]-table[rows_end, cols]-table[rows, cols_end]
+
+# slices picking the first and second pixel of every vertical or horizontal neighbour pair
+def neighbour_slices(vertical):
+    if vertical:
+        return (slice(None, -1), slice(None)), (slice(1, None), slice(None))
+    return (slice(None), slice(None, -1)), (slice(None), slice(1, None))
+
+# old seams of one direction: an index per pair of neighbouring pixels into compact arrays
+# holding, for the pairs a previous cut went through, the seam weight and the old and new
+# colours of both pixels; records are read and written in the [weight, colours] layout of
+# CHANNEL_SLICES, and their weights are kept in float64 so that cuts stay the same
+class SeamStore():
+    def __init__(self, h, w):
+        self.index = np.full((h, w), -1, np.int32)
+        self.weights = np.zeros(0, np.float64)
+        self.colours = np.zeros((0, CHANNELS_RGB*4), np.uint8)
+        self.count = 0
+
+    # seam weights of a region of pixel pairs, 0 where there is no seam
+    def region_weights(self, region):
+        index = self.index[region]
+        weights = np.zeros(index.shape, np.float64)
+        has_seam = index >= 0
+        weights[has_seam] = self.weights[index[has_seam]]
+        return weights
+
+    # records of the masked pixel pairs of a region
+    def records(self, region, mask):
+        ids = self.index[region][mask]
+        return np.concatenate([self.weights[ids, None], self.colours[ids]], axis=1)
+
+    # overwrite the records of the masked pixel pairs of a region, appending new seams
+    def update(self, region, mask, records):
+        index = self.index[region]
+        ids = index[mask]
+        new_seam = ids < 0
+        ids[new_seam] = self.count+np.arange(new_seam.sum())
+        index[mask] = ids
+        self.count += int(new_seam.sum())
+        if self.count > len(self.weights):
+            capacity = max(self.count, 2*len(self.weights))
+            self.weights = np.resize(self.weights, capacity)
+            self.colours = np.resize(self.colours, (capacity, self.colours.shape[1]))
+        self.weights[ids] = records[:, 0]
+        self.colours[ids] = records[:, 1:]
+
+    # drop the first columns of pixel pairs and the seams on them
+    def shift(self, shift):
+        self.index[:, :-shift] = self.index[:, shift:]
+        self.index[:, -shift:] = -1
+        has_seam = self.index >= 0
+        ids = self.index[has_seam]
+        self.count = len(ids)
+        self.weights[:self.count] = self.weights[ids]
+        self.colours[:self.count] = self.colours[ids]
+        self.index[has_seam] = np.arange(self.count)
+
+    @property
+    def nbytes(self):
+        return self.index.nbytes+self.weights.nbytes+self.colours.nbytes
+
 class Graph():
-    def __init__(self, h, w, channels):
+    # with a window narrower than w, only that many columns are kept in memory and all
+    # coordinates are relative to it; finished columns are passed to flush(columns, col);
+    # with wrap, that many columns are added to repeat the left edge past the right one;
+    # times and counts of the stages of generation are recorded in profile
+    def __init__(self, h, w, channels, cost_method=CostMethod.FILTER_2D, rng=None, window=None, flush=None,
+                 search_scale=1, wrap=0, profile=NO_PROFILE):
         self.consider_old_seams = True  # whether consider old seams
         self.grad_energy = True  # whether introduce grad into energy func
+        self.cost_method = cost_method  # backend for the matching cost of placements
+        self.search_scale = search_scale  # block size of the coarse placement search, 1 for exhaustive
+        self.rng = np.random.default_rng(rng)  # seed or Generator for patch sampling
+        self.wrap = wrap  # columns repeating the left edge, so that the output tiles horizontally
+        self.profile = profile  # timers and counters of the generation stages
+        self.locked_col = w+wrap  # columns from here on keep their old value in every cut
+        w += wrap
+        self.total_w, self.offset, self.flush = w, 0, flush  # output width and its window
+        self.patch_w = 0  # widest patch blended so far
+        if window is not None and window < w:
+            w = window
         self.w, self.h, self.channels = w, h, channels
         self.filled = np.zeros((self.h, self.w), np.int32)
         self.canvas = np.zeros((self.h, self.w, channels), np.int32)
-        self.graph = maxflow.Graph[float]()
-        self.node_ids = self.graph.add_grid_nodes((self.h, self.w))
-        self.vertical_seams = np.zeros((self.h-1, self.w, CHANNELS_RGB*4+1), np.float64)
-        self.horizontal_seams = np.zeros((self.h, self.w-1, CHANNELS_RGB*4+1), np.float64)
+        self.vertical_seams = SeamStore(self.h-1, self.w)
+        self.horizontal_seams = SeamStore(self.h, self.w-1)
+        # summed tables of the squared canvas and of the filled mask, kept up to date by
+        # update_summed_tables; the canvas stays zero where unfilled so it is already masked
+        self.summed_table = np.zeros((self.h+1, self.w+1), np.float64)
+        self.summed_table_mask = np.zeros((self.h+1, self.w+1), np.float64)
+        # filled pixel count over the whole output and unfilled pixel counts per row and column
+        # of the window, kept up to date by update_fill_index so that progress and holes are
+        # found without full-canvas sums
+        self.filled_count = 0
+        self.unfilled_rows = np.full(self.h, self.w, np.int64)
+        self.unfilled_cols = np.full(self.w, self.h, np.int64)
 
     # start from left-top corner
     def init_graph(self, new_patch, new_pattern_size=None):
         h, w = new_patch.shape[:2]
         if new_pattern_size is None:
             new_pattern_size = (new_patch.shape[0], new_patch.shape[1])
-        row_rand = np.random.randint(0, h-new_pattern_size[0]+1)
-        col_rand = np.random.randint(0, w-new_pattern_size[1]+1)
+        row_rand = self.rng.integers(0, h-new_pattern_size[0]+1)
+        col_rand = self.rng.integers(0, w-new_pattern_size[1]+1)
         new_patch = new_patch[row_rand:row_rand+new_pattern_size[0],
                               col_rand:col_rand+new_pattern_size[1]]
         new_h, new_w = new_patch.shape[:2]
+        old_sqr = np.square(self.canvas[:new_h, :new_w], dtype=np.float64).sum(2)
+        old_filled = self.filled[:new_h, :new_w].copy()
         self.filled[:new_h, :new_w] = 1
         self.canvas[:new_h, :new_w] = new_patch
+        self.update_summed_tables(0, 0, old_sqr, old_filled)
+        self.update_fill_index(0, 0, old_filled)
+        self.patch_w = max(self.patch_w, new_w)
+        self.slide_window()
+        self.wrap_edge()
+
+    # add the change inside a rectangle of the canvas to the summed tables
+    def update_summed_tables(self, row, col, old_sqr, old_filled):
+        h, w = old_sqr.shape
+        new_sqr = np.square(self.canvas[row:row+h, col:col+w], dtype=np.float64).sum(2)
+        new_filled = self.filled[row:row+h, col:col+w]
+        for table, delta in ((self.summed_table, new_sqr-old_sqr),
+                             (self.summed_table_mask, (new_filled-old_filled).astype(np.float64))):
+            # entries below and right of the rectangle see its whole change
+            summed_delta = delta.cumsum(axis=0).cumsum(axis=1)
+            table[row+1:row+h+1, col+1:col+w+1] += summed_delta
+            table[row+h+1:, col+1:col+w+1] += summed_delta[-1]
+            table[row+1:row+h+1, col+w+1:] += summed_delta[:, -1:]
+            table[row+h+1:, col+w+1:] += summed_delta[-1, -1]
+
+    # count the pixels of a rectangle that have just been filled
+    def update_fill_index(self, row, col, old_filled):
+        h, w = old_filled.shape
+        newly_filled = self.filled[row:row+h, col:col+w]-old_filled
+        self.filled_count += int(newly_filled.sum())
+        self.unfilled_rows[row:row+h] -= newly_filled.sum(axis=1)
+        self.unfilled_cols[col:col+w] -= newly_filled.sum(axis=0)
+
+    # move the window right past the columns no patch can reach anymore, flushing them;
+    # the canvas is filled left to right and every patch covers an unfilled pixel, so the
+    # columns left of the first unfilled one by a patch width are finished, while keeping
+    # a patch width right of the filled ones leaves every placement overlapping them in view
+    def slide_window(self):
+        if self.offset+self.w == self.total_w:
+            return
+        filled_cols = np.flatnonzero(self.unfilled_cols < self.h)
+        if len(filled_cols) == 0 or filled_cols[-1]+self.patch_w < self.w:
+            return
+        first_unfilled = np.flatnonzero(self.unfilled_cols)[0]
+        shift = min(first_unfilled-self.patch_w+1, self.total_w-self.w-self.offset)
+        if shift <= 0:
+            return
+
+        with self.profile.stage('flush'):
+            self.flush(self.canvas[:, :shift], self.offset)
+        for arr in (self.canvas, self.filled):
+            arr[:, :-shift] = arr[:, shift:]
+            arr[:, -shift:] = 0
+        self.vertical_seams.shift(shift)
+        self.horizontal_seams.shift(shift)
+        # summed tables lose the sums of the flushed columns, which are exact integers
+        for table in (self.summed_table, self.summed_table_mask):
+            table[:, 1:-shift] = table[:, 1+shift:]-table[:, shift:shift+1]
+            table[:, -shift:] = table[:, -shift-1:-shift]
+        self.unfilled_rows += shift
+        self.unfilled_cols[:-shift] = self.unfilled_cols[shift:]
+        self.unfilled_cols[-shift:] = self.h
+        self.offset += shift
+
+    # once the first wrap columns are finished, repeat them past the right edge as filled canvas
+    # and lock the right half of the repeat, so that later placements and cuts see the left edge
+    # next to the right one and the tile starting at wrap//2 ends on its own first column
+    def wrap_edge(self):
+        if self.wrap == 0 or self.locked_col < self.w:
+            return
+        unfilled_cols = np.flatnonzero(self.unfilled_cols)
+        if len(unfilled_cols) and unfilled_cols[0] < self.wrap+self.patch_w-1:
+            return
+
+        col = self.w-self.wrap
+        old_sqr = np.square(self.canvas[:, col:], dtype=np.float64).sum(2)
+        old_filled = self.filled[:, col:].copy()
+        self.canvas[:, col:] = self.canvas[:, :self.wrap]
+        self.filled[:, col:] = 1
+        self.update_summed_tables(0, col, old_sqr, old_filled)
+        self.update_fill_index(0, col, old_filled)
+        self.locked_col = col+self.wrap//2
+
+    # the horizontally tiling part of a wrapped canvas
+    def tile(self):
+        return self.canvas[:, self.wrap//2:self.wrap//2+self.w-self.wrap]
+
+    # pass the columns left in the window to flush
+    def flush_window(self):
+        with self.profile.stage('flush'):
+            self.flush(self.canvas, self.offset)
+
+    # largest 4-connected unfilled region as (area, row, col) of a pixel on its left
+    # frontier; only the fill counts giving the bounding box of the unfilled pixels are kept
+    # up to date, the regions being labelled anew within that box on every call
+    def largest_hole(self):
+        rows, cols = np.flatnonzero(self.unfilled_rows), np.flatnonzero(self.unfilled_cols)
+        if len(rows) == 0:
+            return None
+        top, left = rows[0], cols[0]
+        unfilled = (self.filled[top:rows[-1]+1, left:cols[-1]+1] == 0).astype(np.uint8)
+        _, labels, stats, _ = cv2.connectedComponentsWithStats(unfilled, connectivity=4)
+        label = 1+np.argmax(stats[1:, cv2.CC_STAT_AREA])
+        hole_left = stats[label, cv2.CC_STAT_LEFT]
+        hole_rows = np.flatnonzero(labels[:, hole_left] == label)
+        return stats[label, cv2.CC_STAT_AREA], top+hole_rows[len(hole_rows)//2], left+hole_left
 
     # matching cost, fast with summed table and FFT
     def fast_cost_fn(self, new_patch, row_range, col_range):
         new_value = new_patch
         new_h, new_w = new_patch.shape[:2]
-        mask = np.expand_dims(self.filled, -1)
-        canvas_with_mask = mask*self.canvas
+        y, x = len(row_range), len(col_range)
+        # only the part of the canvas reached from the placements in range is correlated
+        rows = slice(row_range[0], row_range[0]+y+new_h-1)
+        cols = slice(col_range[0], col_range[0]+x+new_w-1)
 
         # summed table for speed up
-        summed_table = np.zeros((self.h+1, self.w+1), np.float64)
-        summed_table[1:, 1:] = np.power(canvas_with_mask, 2).sum(2)
-        summed_table = summed_table.cumsum(axis=0).cumsum(axis=1)
-        y_start, x_start = new_h, new_w
-        y, x = len(row_range), len(col_range)
-        term2 = summed_table[0:y, 0:x] + \
-            summed_table[y_start:y_start+y, x_start:x_start+x] - \
-            summed_table[y_start:y_start+y, 0:x] - \
-            summed_table[0:y, x_start:x_start+x]
-
-        # FFT for speed up
-        term3 = cv2.filter2D(canvas_with_mask, -1, new_value, anchor=(0, 0))[0:y, 0:x].sum(axis=2)
-        term1 = cv2.filter2D(np.tile(mask, (1, 1, self.channels)), -1, np.power(new_value, 2), anchor=(0, 0))[0:y, 0:x].sum(axis=2)
+        term2 = box_sum(self.summed_table, row_range, col_range, new_h, new_w)
+
+        # FFT for speed up, channel by channel on float64 as small kernels are filtered
+        # directly, which supports neither integer images nor multi-channel kernels
+        canvas = self.canvas[rows, cols].astype(np.float64)
+        new_value = new_value.astype(np.float64)
+        term3 = sum(cv2.filter2D(canvas[..., c], cv2.CV_64F, new_value[..., c], anchor=(0, 0))[0:y, 0:x]
+                    for c in range(self.channels))
+        term1 = cv2.filter2D(self.filled[rows, cols].astype(np.float64), cv2.CV_64F, np.square(new_value).sum(2), anchor=(0, 0))[0:y, 0:x]
  
         # summed table for mask count calculation speed up
-        summed_table_mask = np.zeros((self.h+1, self.w+1), np.float64)
-        summed_table_mask[1:, 1:] = mask[:, :, 0]
-        summed_table_mask = summed_table_mask.cumsum(axis=0).cumsum(axis=1)
-        mask_count = summed_table_mask[0:y, 0:x] + \
-            summed_table_mask[y_start:y_start+y, x_start:x_start+x] - \
-            summed_table_mask[y_start:y_start+y, 0:x] - \
-            summed_table_mask[0:y, x_start:x_start+x]
+        mask_count = box_sum(self.summed_table_mask, row_range, col_range, new_h, new_w)
         
         # must cover some area
         cost_table = term1.astype(np.float64)+term2-2*term3
@@ -81,6 +272,112 @@ class Graph():
         cost_table = INF*zero_mask+(cost_table/(mask_count+1e-8))*not_zero_mask
         return cost_table, mask_count
 
+    # matching cost in float32, one multi-channel template matching correlation
+    def template_cost_fn(self, new_patch, row_range, col_range):
+        new_h, new_w = new_patch.shape[:2]
+        y, x = len(row_range), len(col_range)
+        # only the part of the canvas reached from the placements in range is correlated
+        rows = slice(row_range[0], row_range[0]+y+new_h-1)
+        cols = slice(col_range[0], col_range[0]+x+new_w-1)
+
+        # image and template channels are laid out so that the channel sum of the correlation
+        # is sum(mask*canvas^2) + sum(mask*pattern^2) - 2*sum(canvas*pattern)
+        image = np.empty((y+new_h-1, x+new_w-1, self.channels+2), np.float32)
+        canvas_with_mask, mask = image[..., :self.channels], image[..., self.channels]
+        mask[:] = self.filled[rows, cols]
+
+        # centre on the pattern mean to keep float32 sums small, the masked SSD does not change
+        mean = new_patch.reshape(-1, self.channels).mean(axis=0).astype(np.float32)
+        pattern = (new_patch-mean).astype(np.float32)
+        canvas_with_mask[:] = self.canvas[rows, cols]
+        canvas_with_mask -= mean
+        canvas_with_mask *= mask[..., None]
+        np.square(canvas_with_mask).sum(axis=2, out=image[..., self.channels+1])
+        template = np.empty((new_h, new_w, self.channels+2), np.float32)
+        template[..., :self.channels] = -2*pattern
+        template[..., self.channels] = np.square(pattern).sum(axis=2)
+        template[..., self.channels+1] = 1
+        cost_table = np.maximum(cv2.matchTemplate(image, template, cv2.TM_CCORR), 0)
+
+        # summed table for mask count calculation speed up
+        mask_count = box_sum(self.summed_table_mask, row_range, col_range, new_h, new_w)
+
+        # must cover some area
+        zero_mask = mask_count == 0
+        cost_table = np.where(zero_mask, INF, cost_table/np.maximum(mask_count, 1)).astype(np.float32)
+        return cost_table, mask_count
+
+    # matching cost of every placement with the selected backend
+    def placement_cost_fn(self, new_patch, row_range, col_range):
+        if self.cost_method is CostMethod.MATCH_TEMPLATE:
+            return self.template_cost_fn(new_patch, row_range, col_range)
+        return self.fast_cost_fn(new_patch, row_range, col_range)
+
+    # coarse-to-fine matching cost: placements on a grid of search_scale are scored with block
+    # sums of the canvas against block means of the pattern, then the best ones are scored again
+    # at full resolution together with their neighbours; returns the (row, col) placements that
+    # were scored with their costs and mask counts, or None when no coarse placement is valid
+    def pyramid_cost_fn(self, new_patch, row_range, col_range, min_overlap, max_overlap):
+        s = self.search_scale
+        new_h, new_w = new_patch.shape[:2]
+        y, x = len(row_range), len(col_range)
+        # the grid columns are multiples of s in the output, not in the window, so that a
+        # window slid by any amount scores the same placements as the whole canvas
+        lead = -(self.offset+col_range[0]) % s
+        block_h, block_w = new_h//s, new_w//s
+        coarse_y, coarse_x = (y-1)//s+1, max(0, (x-lead-1)//s+1)
+        if block_h == 0 or block_w == 0 or coarse_x == 0:
+            return None
+
+        # block sums of the canvas band reached from the coarse placements, those of the squared
+        # canvas and of the mask read off their summed tables at the block corners
+        band_h, band_w = coarse_y+block_h-1, coarse_x+block_w-1
+        band_t, band_l = row_range[0], col_range[0]+lead
+        corners = np.ix_(band_t+s*np.arange(band_h+1), band_l+s*np.arange(band_w+1))
+        canvas_sqr, mask = [np.diff(np.diff(table[corners], axis=0), axis=1)
+                            for table in (self.summed_table, self.summed_table_mask)]
+        canvas = self.canvas[band_t:band_t+band_h*s, band_l:band_l+band_w*s]
+        canvas = np.add.reduceat(np.add.reduceat(canvas, np.arange(0, band_h*s, s), axis=0),
+                                 np.arange(0, band_w*s, s), axis=1).astype(np.float64)
+        pattern = new_patch[:block_h*s, :block_w*s].reshape(block_h, s, block_w, s, self.channels).sum(
+            axis=(1, 3), dtype=np.float64)
+
+        # masked SSD of the canvas against the block means of the pattern, scaled by the squared
+        # block area so that every term is a sum of integers; large kernels are filtered through
+        # a DFT whose rounding depends on the band size, so rounding back to integers makes the
+        # costs the same in a window as in the whole canvas
+        n = s*s
+        term1 = np.rint(cv2.filter2D(mask, cv2.CV_64F, np.square(pattern).sum(axis=2), anchor=(0, 0)))
+        term2 = np.rint(cv2.filter2D(canvas_sqr, cv2.CV_64F, np.ones((block_h, block_w)), anchor=(0, 0)))
+        # channel by channel, as small multi-channel kernels are refused
+        term3 = sum(np.rint(cv2.filter2D(canvas[..., c], cv2.CV_64F, pattern[..., c], anchor=(0, 0)))
+                    for c in range(self.channels))
+        mask_count = np.rint(cv2.filter2D(mask, cv2.CV_64F, np.ones((block_h, block_w)), anchor=(0, 0)))
+        cost_table = ((term1+n*n*term2-2*n*term3)/(n*n*np.maximum(mask_count, 1)))[:coarse_y, :coarse_x]
+
+        # overlaps of the whole blocks stand for those of the full pattern
+        mask_count = mask_count[:coarse_y, :coarse_x]*(new_h*new_w)/(block_h*block_w*s*s)
+        valid = (mask_count <= max_overlap) & (mask_count >= min_overlap)
+        if valid.sum() == 0:
+            return None
+        coarse = np.flatnonzero(valid)
+        coarse = coarse[np.argsort(cost_table.reshape(-1)[coarse], kind='stable')[:PYRAMID_CANDIDATES]]
+
+        # full resolution costs in the neighbourhood of each candidate
+        costs = np.full((y, x), INF)
+        counts = np.zeros((y, x))
+        scored = np.zeros((y, x), bool)
+        for i, j in zip(*np.unravel_index(coarse, (coarse_y, coarse_x))):
+            top, bottom = max(0, (i-1)*s+1), min(y, (i+1)*s)
+            left, right = max(0, lead+(j-1)*s+1), min(x, lead+(j+1)*s)
+            costs[top:bottom, left:right], counts[top:bottom, left:right] = self.placement_cost_fn(
+                new_patch, row_range[top:bottom], col_range[left:right])
+            scored[top:bottom, left:right] = True
+
+        scored_rows, scored_cols = np.nonzero(scored)
+        return (np.array(row_range)[scored_rows], np.array(col_range)[scored_cols],
+                costs[scored], counts[scored])
+
     # matching cost, slow
     def cost_fn(self, new_patch):
         new_t, new_l, new_h, new_w, new_value = new_patch
@@ -94,241 +391,252 @@ class Graph():
         overlap_cost /= overlap_count 
         return overlap_cost, overlap_count
 
-    # energy func
-    def weight_fn(self, new_value, row_idx, col_idx, new_t, new_l, vertical, 
-                  ord=2, eps=1e-8, old_value_1=None, old_value_2=None):
-        new_value = new_value[:,:, CHANNEL_SLICES[0]]
-        # could specify old_value
-        if old_value_1 is None:
-            old_value_1 = self.canvas[row_idx][col_idx][CHANNEL_SLICES[0]]
-        if old_value_2 is None:
-            old_value_2 = self.canvas[row_idx+1][col_idx][CHANNEL_SLICES[0]] if vertical else self.canvas[row_idx][col_idx+1][CHANNEL_SLICES[0]]
-        ws = np.linalg.norm(old_value_1-new_value[row_idx-new_t][col_idx-new_l], ord=ord)
-        if vertical:
-            wt = np.linalg.norm(old_value_2-new_value[row_idx-new_t+1][col_idx-new_l], ord=ord)
-            grad_s = np.linalg.norm(old_value_1-old_value_2, ord=ord)
-            grad_t = np.linalg.norm(new_value[row_idx-new_t][col_idx-new_l]-new_value[row_idx-new_t+1][col_idx-new_l], ord=ord)
-        else:
-            wt = np.linalg.norm(old_value_2-new_value[row_idx-new_t][col_idx-new_l+1], ord=ord)
-            grad_s = np.linalg.norm(old_value_1-old_value_2, ord=ord)
-            grad_t = np.linalg.norm(new_value[row_idx-new_t][col_idx-new_l]-new_value[row_idx-new_t][col_idx-new_l+1], ord=ord)
+    # energy func, vectorized over arrays of neighbouring pixel pairs
+    def weight_fn(self, old_value_1, old_value_2, new_value_1, new_value_2, ord=2, eps=1e-8):
+        ws = np.linalg.norm(old_value_1-new_value_1, ord=ord, axis=-1)
+        wt = np.linalg.norm(old_value_2-new_value_2, ord=ord, axis=-1)
+        grad_s = np.linalg.norm(old_value_1-old_value_2, ord=ord, axis=-1)
+        grad_t = np.linalg.norm(new_value_1-new_value_2, ord=ord, axis=-1)
         w = ws+wt
         # integrate grad into energy function
         if self.grad_energy:
             w /= (grad_s+grad_t)*2+eps
         return w
-        
+
+    # edges along one direction of the patch, keyed by the row-major walk over the patch
+    # so that they can be loaded into maxflow in the same order as a per-pixel loop would
+    def direction_edges(self, filled, old_value, new_value, seams, region, node_ids, vertical):
+        first, second = neighbour_slices(vertical)
+        slot = 0 if vertical else 2
+        lin = np.arange(filled.size).reshape(filled.shape)[first]
+        edge_mask = filled[first] & filled[second]
+        seam_mask = edge_mask & (seams.region_weights(region) > 0) if self.consider_old_seams \
+            else np.zeros_like(edge_mask)
+        plain_mask = edge_mask & ~seam_mask
+        new_1, new_2 = new_value[first], new_value[second]
+
+        # plain edges between neighbouring pixels
+        plain = (lin[plain_mask]*4+slot,
+                 node_ids[first][plain_mask], node_ids[second][plain_mask],
+                 self.weight_fn(old_value[first][plain_mask], old_value[second][plain_mask],
+                                new_1[plain_mask], new_2[plain_mask]))
+
+        # old seam nodes sit between both pixels and connect to the sink with the old seam cost
+        seam_values = seams.records(region, seam_mask)
+        seam = (lin[seam_mask]*4+slot,
+                node_ids[first][seam_mask], node_ids[second][seam_mask],
+                self.weight_fn(seam_values[:, CHANNEL_SLICES[1]], seam_values[:, CHANNEL_SLICES[2]],
+                               new_1[seam_mask], new_2[seam_mask]),
+                self.weight_fn(seam_values[:, CHANNEL_SLICES[3]], seam_values[:, CHANNEL_SLICES[4]],
+                               new_1[seam_mask], new_2[seam_mask]),
+                seam_values[:, 0])
+        return plain, seam
+
+    # build the graph of a patch as flat (edge, tedge) arrays for bulk loading into maxflow,
+    # pixel nodes are numbered row-major within the patch and followed by the old seam nodes
     def create_graph(self, new_patch):
         new_t, new_l, new_h, new_w, new_value = new_patch
         new_r, new_b = new_l + new_w, new_t + new_h
-        src_tedge_count = 0
-        sink_tedge_count = 0
-        nodes = []
-        edges = []
-        tedges = []
-        node_count = self.h*self.w
-        for row_idx in range(new_t, new_b):
-            for col_idx in range(new_l, new_r):
-                # only consider filled pixels
-                if not self.filled[row_idx, col_idx]:
-                    continue
-                if row_idx < new_b - 1 and self.filled[row_idx+1, col_idx]:
-                    # add old seam nodes 
-                    if self.consider_old_seams and self.vertical_seams[row_idx, col_idx][0] > 0:
-                        nodes.append(node_count)
-                        weight = self.vertical_seams[row_idx, col_idx, 0]
-                        tedges.append((node_count, 0, weight))
-                        weight = self.weight_fn(
-                            new_value, row_idx, col_idx, new_t, new_l, True, 
-                            old_value_1=self.vertical_seams[row_idx, col_idx, CHANNEL_SLICES[1]], 
-                            old_value_2=self.vertical_seams[row_idx, col_idx, CHANNEL_SLICES[2]])
-                        edges.append((self.node_ids[row_idx][col_idx],
-                                      node_count, weight))
-                        weight = self.weight_fn(
-                            new_value, row_idx, col_idx, new_t, new_l, True,
-                            old_value_1=self.vertical_seams[row_idx, col_idx, CHANNEL_SLICES[3]],
-                            old_value_2=self.vertical_seams[row_idx, col_idx, CHANNEL_SLICES[4]])
-                        edges.append((self.node_ids[row_idx+1][col_idx],
-                                      node_count, weight))
-                        node_count += 1
-                    else:
-                        weight = self.weight_fn(new_value, row_idx, 
-                                                col_idx, new_t, new_l, True)
-                        edges.append((self.node_ids[row_idx][col_idx],
-                                      self.node_ids[row_idx+1][col_idx],
-                                      weight))
-                if col_idx < new_r - 1 and self.filled[row_idx, col_idx+1]:
-                    if self.consider_old_seams and self.horizontal_seams[row_idx, col_idx][0] > 0:
-                        nodes.append(node_count)
-                        weight = self.horizontal_seams[row_idx, col_idx, 0]
-                        tedges.append((node_count, 0, weight))
-                        weight = self.weight_fn(
-                            new_value, row_idx, col_idx, new_t, new_l, False,
-                            old_value_1=self.horizontal_seams[row_idx, col_idx, CHANNEL_SLICES[1]],
-                            old_value_2=self.horizontal_seams[row_idx, col_idx, CHANNEL_SLICES[2]])
-                        edges.append((self.node_ids[row_idx][col_idx],
-                                      node_count, weight))
-                        weight = self.weight_fn(
-                            new_value, row_idx, col_idx, new_t, new_l, False,
-                            old_value_1=self.horizontal_seams[row_idx, col_idx, CHANNEL_SLICES[3]],
-                            old_value_2=self.horizontal_seams[row_idx, col_idx, CHANNEL_SLICES[4]])
-                        edges.append((self.node_ids[row_idx][col_idx+1],
-                                      node_count, weight))
-                        node_count += 1
-                    else:
-                        weight = self.weight_fn(new_value, row_idx, 
-                                                col_idx, new_t, new_l, False)
-                        edges.append((self.node_ids[row_idx][col_idx], 
-                                      self.node_ids[row_idx][col_idx+1],
-                                      weight))
-                # to new patch (sink)
-                if row_idx > new_t and not self.filled[row_idx-1, col_idx] or \
-                        row_idx < new_b-1 and not self.filled[row_idx+1, col_idx] or \
-                        col_idx > new_l and not self.filled[row_idx, col_idx-1] or \
-                        col_idx < new_r-1 and not self.filled[row_idx, col_idx+1]:
-                    tedges.append((self.node_ids[row_idx][col_idx], 0, np.inf))
-                    src_tedge_count += 1
-
-                # from existing region (source)
-                if row_idx == new_t and row_idx > 0 and self.filled[row_idx-1, col_idx] or \
-                        row_idx == new_b-1 and row_idx < self.h-1 and self.filled[row_idx+1, col_idx] or \
-                        col_idx == new_l and col_idx > 0 and self.filled[row_idx, col_idx-1] or \
-                        col_idx == new_r-1 and col_idx < self.w-1 and self.filled[row_idx, col_idx+1]:
-                    tedges.append((self.node_ids[row_idx][col_idx], np.inf, 0))
-                    sink_tedge_count += 1
-        return nodes, edges, tedges
-
-    def match_patch(self, pattern, row=-1, col=-1, mode='random', k=10, new_pattern_size=None):
+        filled = self.filled[new_t:new_b, new_l:new_r].astype(bool)
+        old_value = self.canvas[new_t:new_b, new_l:new_r, CHANNEL_SLICES[0]]
+        new_value = new_value[:, :, CHANNEL_SLICES[0]]
+        node_count = new_h*new_w
+        node_ids = np.arange(node_count).reshape((new_h, new_w))
+
+        v_plain, v_seam = self.direction_edges(
+            filled, old_value, new_value, self.vertical_seams, np.s_[new_t:new_b-1, new_l:new_r], node_ids, True)
+        h_plain, h_seam = self.direction_edges(
+            filled, old_value, new_value, self.horizontal_seams, np.s_[new_t:new_b, new_l:new_r-1], node_ids, False)
+
+        # number the old seam nodes in the order their pixels are visited
+        seam_keys, seam_i, seam_j, seam_w_1, seam_w_2, seam_weights = \
+            [np.concatenate(arrs) for arrs in zip(v_seam, h_seam)]
+        seam_ids = np.empty(len(seam_keys), np.int64)
+        seam_ids[np.argsort(seam_keys, kind='stable')] = node_count+np.arange(len(seam_keys))
+
+        keys = np.concatenate([v_plain[0], h_plain[0], seam_keys, seam_keys+1])
+        order = np.argsort(keys, kind='stable')
+        edges = (np.concatenate([v_plain[1], h_plain[1], seam_i, seam_j])[order],
+                 np.concatenate([v_plain[2], h_plain[2], seam_ids, seam_ids])[order],
+                 np.concatenate([v_plain[3], h_plain[3], seam_w_1, seam_w_2])[order])
+
+        # to new patch (sink): filled pixels next to an unfilled pixel of the patch
+        unfilled = ~filled
+        next_to_unfilled = np.zeros_like(filled)
+        next_to_unfilled[1:] |= unfilled[:-1]
+        next_to_unfilled[:-1] |= unfilled[1:]
+        next_to_unfilled[:, 1:] |= unfilled[:, :-1]
+        next_to_unfilled[:, :-1] |= unfilled[:, 1:]
+        to_sink = filled & next_to_unfilled
+
+        # from existing region (source): filled pixels on the patch border next to filled canvas
+        next_to_filled = np.zeros_like(filled)
+        if new_t > 0:
+            next_to_filled[0] |= self.filled[new_t-1, new_l:new_r].astype(bool)
+        if new_b < self.h:
+            next_to_filled[-1] |= self.filled[new_b, new_l:new_r].astype(bool)
+        if new_l > 0:
+            next_to_filled[:, 0] |= self.filled[new_t:new_b, new_l-1].astype(bool)
+        if new_r < self.w:
+            next_to_filled[:, -1] |= self.filled[new_t:new_b, new_r].astype(bool)
+        from_source = filled & next_to_filled
+
+        # locked pixels repeating the left edge of a wrapped canvas stay on the old side
+        locked = np.arange(new_l, new_r) >= self.locked_col
+        from_source |= filled & locked
+        to_sink &= ~locked
+
+        terminal_mask = to_sink | from_source
+        tedges = (np.concatenate([node_ids[terminal_mask], seam_ids]),
+                  np.concatenate([np.where(from_source[terminal_mask], np.inf, 0), np.zeros(len(seam_ids))]),
+                  np.concatenate([np.where(to_sink[terminal_mask], np.inf, 0), seam_weights]))
+        return len(seam_ids), edges, tedges
+
+    # a target pixel restricts the placements to those covering it
+    def match_patch(self, pattern, row=-1, col=-1, mode='random', k=10, new_pattern_size=None, target=None):
         if mode == 'opt_sub':
             h, w = pattern.shape[:2]
             if new_pattern_size is None:
                 new_pattern_size = (pattern.shape[0]//2, pattern.shape[1]//2)
-            row_rand = np.random.randint(0, h-new_pattern_size[0]+1)
-            col_rand = np.random.randint(0, w-new_pattern_size[1]+1)
+            row_rand = self.rng.integers(0, h-new_pattern_size[0]+1)
+            col_rand = self.rng.integers(0, w-new_pattern_size[1]+1)
             pattern = pattern[row_rand:row_rand+new_pattern_size[0],
                               col_rand:col_rand+new_pattern_size[1]]
         h, w = pattern.shape[:2]
-        max_overlap = max(int(h*w*0.7), h*w-self.h*self.w+self.filled.sum())
+        max_overlap = max(int(h*w*0.7), h*w-self.h*self.total_w+self.filled_count)
         min_overlap = int(h*w*0.1)
         if row == -1 or col == -1:
+            # a fixed row or column is the only one considered
+            row_range, col_range = range(0, self.h-h+1), range(0, self.w-w+1)
+            if target is not None:
+                row_range = range(max(0, target[0]-h+1), min(target[0], self.h-h)+1)
+                col_range = range(max(0, target[1]-w+1), min(target[1], self.w-w)+1)
+            if row != -1:
+                row_range = range(row, row+1)
+            if col != -1:
+                col_range = range(col, col+1)
+
             if mode == 'random':
-                row = np.random.randint(0, self.h-h+1) if row == -1 else row
-                col = np.random.randint(0, self.w-w+1) if col == -1 else col
+                row = self.rng.integers(row_range.start, row_range.stop) if row == -1 else row
+                col = self.rng.integers(col_range.start, col_range.stop) if col == -1 else col
             elif mode == 'opt_whole' or mode == 'opt_sub':
-                row_range = list(range(0, self.h-h+1, 1))
-                col_range = list(range(0, self.w-w+1, 1))
-                cost_table, mask_count = self.fast_cost_fn(pattern, row_range, col_range)
-                cost_table_flatten = cost_table.reshape((-1))
-                mask_count_flatten = mask_count.reshape((-1))
+                with self.profile.stage('search'):
+                    scored = None
+                    if self.search_scale > 1:
+                        scored = self.pyramid_cost_fn(pattern, row_range, col_range, min_overlap, max_overlap)
+                    if scored is not None:
+                        scored_rows, scored_cols, cost_table_flatten, mask_count_flatten = scored
+                    else:
+                        cost_table, mask_count = self.placement_cost_fn(pattern, row_range, col_range)
+                        cost_table_flatten = cost_table.reshape((-1))
+                        mask_count_flatten = mask_count.reshape((-1))
+                self.profile.count('searches')
+                self.profile.count('placements', len(cost_table_flatten))
+                # once the left edge of a wrapped canvas is repeated past the right one, a placement
+                # over it would change one copy only, so it is never taken, not even as a fallback
+                candidates = np.ones(len(mask_count_flatten), bool)
+                if self.locked_col < self.w:
+                    placement_cols = scored_cols if scored is not None else np.tile(col_range, len(row_range))
+                    candidates = np.asarray(placement_cols) >= self.wrap
                 valid_mask = (mask_count_flatten <= max_overlap) * \
-                    (mask_count_flatten >= min_overlap)
+                    (mask_count_flatten >= min_overlap) * candidates
                 
-                col_num = len(col_range)
-                valid_count = valid_mask.sum()
-                min_mask_count = mask_count_flatten.min()
-                if row != -1:
-                    valid_count = valid_mask.reshape((-1, col_num))[row, :].sum()
-                    min_mask_count = mask_count_flatten.reshape(
-                        (-1, col_num))[row, :].min()
-                if col != -1:
-                    valid_count = valid_mask.reshape((-1, col_num))[:, col].sum()
-                    min_mask_count = mask_count_flatten.reshape(
-                        (-1, col_num))[:, col].min()
-                if valid_count == 0:
-                    p_table_flatten = (
-                        mask_count_flatten == min_mask_count).astype(np.float32)
+                if valid_mask.sum() == 0:
+                    p_table_flatten = (candidates * (
+                        mask_count_flatten == mask_count_flatten[candidates].min())).astype(np.float32)
                 else:
                     sigma = np.std(pattern.reshape(-1, self.channels), axis=0)
                     sigma_sqr = (sigma*sigma).sum()
-                    p_table_flatten = -cost_table_flatten*k/sigma_sqr
-                    p_table_flatten = np.exp(p_table_flatten)
-                    p_table_flatten = p_table_flatten*valid_mask
-                if row != -1:
-                    for idx in range(len(p_table_flatten)):
-                        if idx//col_num != row:
-                            p_table_flatten[idx] = 0
-                if col != -1:
-                    for idx in range(len(p_table_flatten)):
-                        if idx%col_num != col:
-                            p_table_flatten[idx] = 0
+                    # costs relative to the cheapest valid placement, whose weight of 1 keeps the
+                    # weights from all underflowing to 0; a flat pattern takes the cheapest ones only
+                    cost_flatten = np.where(valid_mask, cost_table_flatten, np.inf)
+                    cost_flatten -= cost_flatten.min()
+                    if sigma_sqr > 0:
+                        p_table_flatten = np.exp(-cost_flatten*k/sigma_sqr)
+                    else:
+                        p_table_flatten = (cost_flatten == 0).astype(np.float64)
                 p_table_flatten /= p_table_flatten.sum()
                 p_table_flatten = np.cumsum(p_table_flatten)
-                rand_num = np.random.rand()
-                min_idx = 0
-                for i, p in enumerate(p_table_flatten):
-                    if rand_num < p:
-                        min_idx = i
-                        break
-                row = min_idx // len(col_range)
-                col = min_idx % len(col_range)
+
+                # inverse CDF, first placement whose cumulative probability exceeds the draw,
+                # a draw past a sum rounded below 1 taking the last placement of any weight
+                min_idx = np.searchsorted(p_table_flatten, self.rng.random(), side='right')
+                min_idx = min(min_idx, np.searchsorted(p_table_flatten, p_table_flatten[-1]))
+                if scored is not None:
+                    row, col = scored_rows[min_idx], scored_cols[min_idx]
+                else:
+                    row = row_range[min_idx // len(col_range)]
+                    col = col_range[min_idx % len(col_range)]
             else:
                 raise NotImplementedError()
 
         return (row, col, h, w, pattern)
 
+    # record the cut between old and new pixels of one direction as seams for later cuts
+    def update_seams(self, seams, region, filled, sgm, old_value, new_value, weights, vertical):
+        first, second = neighbour_slices(vertical)
+        edge_mask = filled[first] & filled[second]
+        old_to_new = edge_mask & ~sgm[first] & sgm[second]
+        new_to_old = edge_mask & sgm[first] & ~sgm[second]
+        for cut_mask, value_1, value_2 in ((old_to_new, old_value, new_value),
+                                           (new_to_old, new_value, old_value)):
+            seams.update(region, cut_mask, np.concatenate([
+                    weights[first][cut_mask, None],
+                    value_1[first][cut_mask], value_1[second][cut_mask],
+                    value_2[first][cut_mask], value_2[second][cut_mask]
+                ], axis=-1))
+
     # blend new patch and existing
     def blend(self, pattern_info):
         row, col, h, w, pattern = pattern_info
-        nodes, edges, tedges = self.create_graph((row, col, h, w, pattern))
-        graph = maxflow.Graph[float]()
-        graph.add_nodes(len(nodes)+self.h*self.w)
-        edge_weights = np.zeros((self.h, self.w, 2))
-
-        for edge in edges:
-            graph.add_edge(edge[0], edge[1], edge[2], edge[2])
-            row_, col_ = edge[0]//self.w, edge[0]%self.w
-            if edge[1] == edge[0]+1: 
-                edge_weights[row_, col_, 1] = edge[2]
-            else:
-                edge_weights[row_, col_, 0] = edge[2]
-        for tedge in tedges:
-            graph.add_tedge(tedge[0], tedge[1], tedge[2])
-        graph.maxflow()
-        sgm = graph.get_grid_segments(self.node_ids)
-        for row_idx in range(row, row+h):
-            for col_idx in range(col, col+w):
-
-                # update the old seams
-                if self.consider_old_seams:
-                    if row_idx < row+h-1 and self.filled[row_idx, col_idx] and self.filled[row_idx+1, col_idx]:
-                        if not sgm[row_idx, col_idx] and sgm[row_idx+1, col_idx]:
-                            self.vertical_seams[row_idx][col_idx][0] = edge_weights[row_idx][col_idx][0]
-                            self.vertical_seams[row_idx][col_idx][1:] = np.concatenate([
-                                    self.canvas[row_idx, col_idx, CHANNEL_SLICES[0]],
-                                    self.canvas[row_idx+1, col_idx, CHANNEL_SLICES[0]],
-                                    pattern[row_idx-row, col_idx-col, CHANNEL_SLICES[0]],
-                                    pattern[row_idx-row+1, col_idx-col, CHANNEL_SLICES[0]]
-                                ], axis=-1)
-                        if sgm[row_idx, col_idx] and not sgm[row_idx+1, col_idx]:
-                            self.vertical_seams[row_idx][col_idx][0] = edge_weights[row_idx][col_idx][0]
-                            self.vertical_seams[row_idx][col_idx][1:] = np.concatenate([
-                                    pattern[row_idx-row, col_idx-col, CHANNEL_SLICES[0]],
-                                    pattern[row_idx-row+1, col_idx-col, CHANNEL_SLICES[0]],
-                                    self.canvas[row_idx, col_idx, CHANNEL_SLICES[0]],
-                                    self.canvas[row_idx+1, col_idx, CHANNEL_SLICES[0]],
-                                ], axis=-1)
-                    
-                    if col_idx < col+w-1 and self.filled[row_idx, col_idx] and self.filled[row_idx, col_idx+1]:
-                        if not sgm[row_idx, col_idx] and sgm[row_idx, col_idx+1]:
-                            self.horizontal_seams[row_idx][col_idx][0] = edge_weights[row_idx][col_idx][1]
-                            self.horizontal_seams[row_idx][col_idx][1:] = np.concatenate([
-                                    self.canvas[row_idx, col_idx, CHANNEL_SLICES[0]],
-                                    self.canvas[row_idx, col_idx+1, CHANNEL_SLICES[0]],
-                                    pattern[row_idx-row, col_idx-col, CHANNEL_SLICES[0]],
-                                    pattern[row_idx-row, col_idx-col+1, CHANNEL_SLICES[0]]
-                                ], axis=-1)
-                        if sgm[row_idx, col_idx] and not sgm[row_idx, col_idx+1]:
-                            self.horizontal_seams[row_idx][col_idx][0] = edge_weights[row_idx][col_idx][1]
-                            self.horizontal_seams[row_idx][col_idx][1:] = np.concatenate([
-                                    pattern[row_idx-row, col_idx-col, CHANNEL_SLICES[0]],
-                                    pattern[row_idx-row, col_idx-col+1, CHANNEL_SLICES[0]],
-                                    self.canvas[row_idx, col_idx, CHANNEL_SLICES[0]],
-                                    self.canvas[row_idx, col_idx+1, CHANNEL_SLICES[0]]
-                                ], axis=-1)
-                    
-                if not self.filled[row_idx, col_idx] or self.filled[row_idx, col_idx] and sgm[row_idx, col_idx]:
-                        self.canvas[row_idx, col_idx] = pattern[row_idx-row, col_idx-col]
-        self.filled[row:row+h, col:col+w] = 1
+        with self.profile.stage('graph'):
+            seam_count, edges, tedges = self.create_graph((row, col, h, w, pattern))
+            graph = maxflow.Graph[float]()
+            node_ids = graph.add_grid_nodes((h, w))
+            graph.add_nodes(seam_count)
+            # maxflow refuses zero-sized arrays
+            if len(edges[0]):
+                graph.add_edges(edges[0], edges[1], edges[2], edges[2])
+            if len(tedges[0]):
+                graph.add_grid_tedges(tedges[0], tedges[1], tedges[2])
+
+            # weight of the last edge leaving each pixel, [0] vertical and [1] horizontal
+            edge_weights = np.zeros((h, w, 2))
+            edge_slots = edges[0]*2+((edges[1] == edges[0]+1) & (edges[1] < h*w))
+            _, last = np.unique(edge_slots[::-1], return_index=True)
+            last = len(edge_slots)-1-last
+            edge_weights.reshape(-1)[edge_slots[last]] = edges[2][last]
+        self.profile.count('blends')
+        self.profile.count('nodes', h*w+seam_count)
+        self.profile.count('seam_nodes', seam_count)
+        self.profile.count('edges', len(edges[0]))
+        with self.profile.stage('maxflow'):
+            graph.maxflow()
+            sgm = graph.get_grid_segments(node_ids)
+
+        with self.profile.stage('update'):
+            old_filled = self.filled[row:row+h, col:col+w].copy()
+            filled = old_filled.astype(bool)
+            canvas = self.canvas[row:row+h, col:col+w]
+            old_sqr = np.square(canvas, dtype=np.float64).sum(2)
+
+            # update the old seams
+            if self.consider_old_seams:
+                old_value, new_value = canvas[..., CHANNEL_SLICES[0]], pattern[..., CHANNEL_SLICES[0]]
+                self.update_seams(self.vertical_seams, np.s_[row:row+h-1, col:col+w], filled, sgm,
+                                  old_value, new_value, edge_weights[..., 0], True)
+                self.update_seams(self.horizontal_seams, np.s_[row:row+h, col:col+w-1], filled, sgm,
+                                  old_value, new_value, edge_weights[..., 1], False)
+
+            # new patch wins on unfilled pixels and on the sink side of the cut
+            new_mask = ~filled | sgm
+            canvas[new_mask] = pattern[new_mask]
+            self.filled[row:row+h, col:col+w] = 1
+            self.update_summed_tables(row, col, old_sqr, old_filled)
+            self.update_fill_index(row, col, old_filled)
+        self.patch_w = max(self.patch_w, w)
+        self.slide_window()
+        self.wrap_edge()
 
     def show_canvas(self):
         show_img(self.canvas)
@@ -338,13 +646,14 @@ class Graph():
 
 
 if __name__ == '__main__':   
-    g = Graph(10, 10)
-    g.init_graph(np.ones((5, 5, self.channels), np.int32)*2) 
-    nodes, edges, tedges = g.create_graph((2, 2, 5, 5, np.zeros((5, 5, self.channels)).astype(np.int32)))
+    from viz import plot_graph_2d
+
+    g = Graph(10, 10, 3)
+    g.init_graph(np.ones((5, 5, g.channels), np.int32)*2) 
+    seam_count, edges, tedges = g.create_graph((2, 2, 5, 5, np.zeros((5, 5, g.channels)).astype(np.int32)))
     graph = maxflow.Graph[float]()
-    nodes = graph.add_grid_nodes((g.h, g.w))
-    for edge in edges:
-        graph.add_edge(edge[0], edge[1], edge[2], edge[2])
-    for tedge in tedges:
-        graph.add_tedge(tedge[0], tedge[1], tedge[2])
-    plot_graph_2d(graph, (10, 10)) 
\ No newline at end of file
+    nodes = graph.add_grid_nodes((5, 5))
+    graph.add_nodes(seam_count)
+    graph.add_edges(edges[0], edges[1], edges[2], edges[2])
+    graph.add_grid_tedges(tedges[0], tedges[1], tedges[2])
+    plot_graph_2d(graph, (5, 5))
@@ -5,8 +5,12 @@ import numpy as np
 import cv2
 
 from graph import Graph
-from custom_io import debug_out, increment_status_message
-from graphEnums import GenDirection, GenMethod
+from custom_io import debug_out, increment_status_message, end_status_line
+from graphEnums import GenDirection, GenMethod, CostMethod
+from profiling import NO_PROFILE
+
+# columns kept in memory when streaming, in widths of the widest patch
+STREAM_WINDOW_PATCHES = 4
 
 def main():
     path_in = sys.argv[1] if len(sys.argv) > 1 else quit()
@@ -26,18 +30,33 @@ def main():
     image_out = graphCut( pattern, direction, patchFactor, mode, target_h, target_w)
     cv2.imwrite(path_out, image_out)
 
-def graphCut( image_in, direction = GenDirection.HORIZONAL, patchFactor = 8, mode = GenMethod.SUBBLOCK_ROW, h_out = 0, w_out = 0):
+def graphCut( image_in, direction = GenDirection.HORIZONAL, patchFactor = 8, mode = GenMethod.SUBBLOCK_ROW, h_out = 0, w_out = 0, costMethod = CostMethod.FILTER_2D, seed = None, stream = None, searchScale = 1, wrap = False, profile = NO_PROFILE):
     # def graphCut(inputImage.int32 direction patchFactor mode[1-3] outputWidth outputHeight):
     # parameters:
     # inputImage -> cv2.imread(path)
     # direction -> horizontal or bi-directional generation (enum style?)
     # patchFactor -> determines size of patches used during generation
     #                   width only for horizontal generation
-    # mode -> int value from 1 to 3, using the starter code
+    # mode -> int value from 1 to 4, 1 to 3 using the starter code
     # outputWidth, outputHeight -> outputHeight equals inputHeight for horizontal generation
+    # costMethod -> backend computing the matching cost of patch placements
+    # seed -> int seed or numpy Generator for patch sampling, None for a fresh one
+    # stream -> stream(columns, col) receiving finished uint8 columns as soon as they are done,
+    #           so that memory does not grow with the output width; nothing is returned then
+    #           (horizontal generation of a strip as high as the input only)
+    # searchScale -> block size of a coarse placement search refined around its best candidates,
+    #                1 for the exhaustive search; larger is faster but may miss the best placements
+    # wrap -> generate an output whose right edge continues into its left one, so that it tiles
+    #         (horizontal generation of a strip as high as the input only, at least 3 patches wide)
+    # profile -> profiling.Profile collecting the times of placement search, graph construction, maxflow
+    #            and canvas updates, and counts of searches, blends, nodes and edges
 
     if (h_out == 0) and (w_out == 0):
         return image_in
+    if stream is not None and (direction is not GenDirection.HORIZONAL or h_out != image_in.shape[0]):
+        raise ValueError("streaming generation needs a horizontal strip as high as the input")
+    if wrap and (direction is not GenDirection.HORIZONAL or h_out != image_in.shape[0] or stream is not None):
+        raise ValueError("tiling generation needs a horizontal strip as high as the input, without streaming")
 
     image_in = image_in.astype(np.int32)
     h_in, w_in, channels = image_in.shape
@@ -45,16 +64,23 @@ def graphCut( image_in, direction = GenDirection.HORIZONAL, patchFactor = 8, mod
     PATCH_W_RATIO = patchFactor
     sub_patch_size = (h_in//PATCH_H_RATIO, w_in//PATCH_W_RATIO)
 
-    g = Graph(h_out, w_out, channels)
-    max = g.w*g.h
-    sys.stdout.write('\n')
+    patch_w = w_in if mode is GenMethod.GLOBAL_ROW else sub_patch_size[1]
+    if wrap and w_out < 3*patch_w:
+        raise ValueError("tiling generation needs an output at least 3 patches wide")
+    window, flush = None, None
+    if stream is not None:
+        window = STREAM_WINDOW_PATCHES*patch_w
+        flush = lambda columns, col: stream(columns.astype(np.uint8), col)
+    g = Graph(h_out, w_out, channels, costMethod, seed, window, flush, searchScale, patch_w if wrap else 0, profile)
+    max = g.total_w*g.h
+    end_status_line()
     debug_out("channels in: %i, channels out: %i\n", image_in.shape[2], g.canvas.shape[2])
 
     # Generate Texture in Random Order using Sub Patches
     if mode is GenMethod.SUBBLOCK_RANDOM:
         g.init_graph(image_in, new_pattern_size=sub_patch_size)
-        while g.filled.sum() < max:
-            increment_status_message(g.filled.sum(), max)
+        while g.filled_count < max:
+            increment_status_message(g.filled_count, max)
             g.blend(
                 g.match_patch(
                     image_in, mode='opt_sub', k=1, new_pattern_size=sub_patch_size))
@@ -64,9 +90,9 @@ def graphCut( image_in, direction = GenDirection.HORIZONAL, patchFactor = 8, mod
         g.init_graph(image_in, new_pattern_size=sub_patch_size)
         start_row = 0
         local_k = 100
-        while g.filled.sum() < max:
-            while g.filled.sum() < (start_row+(h_in//PATCH_H_RATIO))*g.w:
-                increment_status_message(g.filled.sum(), max)
+        while g.filled_count < max:
+            while g.filled_count < (start_row+(h_in//PATCH_H_RATIO))*g.total_w:
+                increment_status_message(g.filled_count, max)
                 g.blend(
                     g.match_patch(
                         image_in, mode='opt_sub', k=local_k, row=start_row, new_pattern_size=sub_patch_size))
@@ -83,9 +109,9 @@ def graphCut( image_in, direction = GenDirection.HORIZONAL, patchFactor = 8, mod
         g.init_graph(image_in)
         start_row = 0
         local_k = 10
-        while g.filled.sum() < max:
-            while g.filled.sum() < (start_row+h_in)*g.w:
-                increment_status_message(g.filled.sum(), max)
+        while g.filled_count < max:
+            while g.filled_count < (start_row+h_in)*g.total_w:
+                increment_status_message(g.filled_count, max)
                 g.blend(
                     g.match_patch(
                         image_in, mode='opt_whole', k=local_k, row=start_row, new_pattern_size=sub_patch_size))
@@ -97,8 +123,23 @@ def graphCut( image_in, direction = GenDirection.HORIZONAL, patchFactor = 8, mod
                 g.blend(pattern_info)
                 start_row = pattern_info[0]
 
-    increment_status_message(g.filled.sum(), max)
-    sys.stdout.write('\n')
+    # Generate Texture by Aiming Sub Patches at the Largest Remaining Hole
+    elif mode is GenMethod.SUBBLOCK_HOLES:
+        g.init_graph(image_in, new_pattern_size=sub_patch_size)
+        while g.filled_count < max:
+            increment_status_message(g.filled_count, max)
+            _, target_row, target_col = g.largest_hole()
+            g.blend(
+                g.match_patch(
+                    image_in, mode='opt_sub', k=1, new_pattern_size=sub_patch_size, target=(target_row, target_col)))
+
+    increment_status_message(g.filled_count, max)
+    end_status_line()
+    if stream is not None:
+        g.flush_window()
+        return None
+    if wrap:
+        return g.tile().astype(np.uint8)
     return g.canvas.astype(np.uint8)
     
 
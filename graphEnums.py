@@ -7,4 +7,9 @@ class GenDirection(Enum):
 class GenMethod(Enum):
     SUBBLOCK_RANDOM = 1
     SUBBLOCK_ROW = 2
-    GLOBAL_ROW = 3
\ No newline at end of file
+    GLOBAL_ROW = 3
+    SUBBLOCK_HOLES = 4
+
+class CostMethod(Enum):
+    FILTER_2D = 1
+    MATCH_TEMPLATE = 2
@@ -1,36 +1,140 @@
+import re
 import cv2
+import json
 import numpy as np
-from sklearn.cluster import KMeans
-from recolourGUI import startGUI
+from cache import contentKey, seedKey
+from profiling import NO_PROFILE
 
 
 #---------- functions ----------# 
 
 
+# k-mean random state from an int seed or a numpy Generator
+def getRandomState( seed ):
+    if isinstance( seed, np.random.Generator ):
+        return int( seed.integers( 2 ** 31 - 1 ) )
+
+    return seed
+
+
 # get palette colours using k-mean
-def getPalette( image, nColours ):
+def getPalette( image, nColours, seed = None, sampleSize = None, cache = None ):
+    # reuse the palette of identical pixels, colour count and seed from the cache
+    if cache is not None:
+        key = contentKey( image, 'palette', nColours, sampleSize, seedKey( seed ) )
+        entry = cache.load( key )
+        if entry is not None:
+            return entry[ 'colours' ], entry[ 'labels' ]
+
+    # scikit-learn is only imported once a palette is extracted, as it is slow to load
+    from sklearn.cluster import KMeans
+
     # reshape image into 1-D array of pixels with input channels
-    pixels = image.copy()
     pixels = image.reshape( ( -1, image.shape[2] ) )
 
-    # k-mean clustering
-    km = KMeans( n_clusters = nColours )
-    km.fit( pixels )
+    # k-mean clustering on a random sample of pixels, then label every pixel in one pass
+    if sampleSize is not None and sampleSize < pixels.shape[0]:
+        rng = np.random.default_rng( seed )
+        sample = pixels[ rng.choice( pixels.shape[0], sampleSize, replace = False ) ]
+        km = KMeans( n_clusters = nColours, random_state = getRandomState( rng ) )
+        km.fit( sample )
+        labels = km.predict( pixels )
+
+    # k-mean clustering on all pixels
+    else:
+        km = KMeans( n_clusters = nColours, random_state = getRandomState( seed ) )
+        km.fit( pixels )
+        labels = km.labels_
 
     # put palette colours into an array
     colours = np.asarray( km.cluster_centers_, dtype = 'uint8' )
 
-    return colours, km.labels_
+    # labels are stored in the smallest integer type that fits the palette
+    if cache is not None:
+        cache.save( key, colours = colours, labels = labels.astype( np.min_scalar_type( nColours - 1 ) ) )
+
+    return colours, labels
+
+
+# map every pixel to its nearest palette colour
+def getPixelMap( image, colours ):
+    pixels = image.reshape( ( -1, image.shape[2] ) ).astype( np.float32 )
+    nearest = np.full( pixels.shape[0], np.inf, np.float32 )
+    pixelMap = np.zeros( pixels.shape[0], np.min_scalar_type( len( colours ) - 1 ) )
+
+    for ix, colour in enumerate( colours.astype( np.float32 ) ):
+        distance = np.square( pixels - colour ).sum( axis = 1 )
+        closer = distance < nearest
+        nearest[ closer ] = distance[ closer ]
+        pixelMap[ closer ] = ix
+
+    return pixelMap
+
+
+# BGR colours from '#rrggbb' codes
+def hexToBGR( codes ):
+    for code in codes:
+        if not re.fullmatch( '#[0-9a-fA-F]{6}', code ):
+            raise ValueError( f'\'{ code }\' is not a colour of the form #rrggbb' )
+
+    return np.array( [ [ int( c[ i : i + 2 ], 16 ) for i in ( 5, 3, 1 ) ] for c in codes ], np.uint8 ).reshape( ( -1, 3 ) )
+
+
+# '#rrggbb' codes from BGR(A) colours
+def bgrToHex( colours ):
+    return [ '#%02x%02x%02x' % tuple( c[ 2 :: -1 ] ) for c in colours ]
+
+
+# read a palette map file, which recolours palettes without the interactive GUI:
+#   "colours" maps source to target colours, replacing the palette colour nearest to each source;
+#   "nearest" lists allowed colours, snapping every palette colour to the nearest one of them
+def loadPaletteMap( path ):
+    with open( path ) as f:
+        spec = json.load( f )
+
+    if not isinstance( spec, dict ) or not set( spec ) <= { 'colours', 'nearest' }:
+        raise ValueError( 'a palette map is an object with \'colours\' and/or \'nearest\' entries' )
+
+    mapping, nearest = spec.get( 'colours', {} ), spec.get( 'nearest', [] )
+    if not isinstance( mapping, dict ) or not all( isinstance( c, str ) for c in mapping.values() ):
+        raise ValueError( '\'colours\' must be an object mapping #rrggbb colours to #rrggbb colours' )
+    if not isinstance( nearest, list ) or not all( isinstance( c, str ) for c in nearest ):
+        raise ValueError( '\'nearest\' must be a list of #rrggbb colours' )
+
+    return { 'sources': hexToBGR( list( mapping.keys() ) ),
+             'targets': hexToBGR( list( mapping.values() ) ),
+             'nearest': hexToBGR( nearest ) }
+
+
+# write a palette map replacing each palette colour by its recoloured one
+def savePaletteMap( path, colours, newColours ):
+    mapping = { s: t for s, t in zip( bgrToHex( colours ), bgrToHex( newColours ) ) if s != t }
+
+    with open( path, 'w' ) as f:
+        json.dump( { 'colours': mapping }, f, indent = 4 )
+
+
+# recolour palette colours according to a palette map, leaving alpha untouched
+def remapPalette( colours, paletteMap ):
+    original = colours[ :, : 3 ].astype( np.int32 )
+    colours = colours.copy()
+
+    if len( paletteMap[ 'nearest' ] ):
+        distance = np.square( original[ :, None ] - paletteMap[ 'nearest' ][ None ] ).sum( axis = 2 )
+        colours[ :, : 3 ] = paletteMap[ 'nearest' ][ distance.argmin( axis = 1 ) ]
+
+    # explicit mappings take precedence over snapping
+    if len( paletteMap[ 'sources' ] ):
+        distance = np.square( paletteMap[ 'sources' ][ :, None ].astype( np.int32 ) - original[ None ] ).sum( axis = 2 )
+        colours[ distance.argmin( axis = 1 ), : 3 ] = paletteMap[ 'targets' ]
+
+    return colours
 
 
 # fit image with only the palette colours
 def reduceColour( image, colours, pixelMap ):
-    pixels = image.copy()
-    pixels = pixels.reshape( ( -1, image.shape[2] ) )
-    
-    for px in range( pixels.shape[0] ):
-        for ix in range( colours.shape[0] ):
-            pixels[px] = colours[pixelMap[px]]
+    # look up the palette colour of every pixel at once
+    pixels = np.asarray( colours, dtype = image.dtype )[ pixelMap ]
 
     result = pixels.reshape( image.shape )
     return result
@@ -90,19 +194,38 @@ def pixelateUp( image, outputWidth, outputHeight ):
     return upImage
 
 
+# source index of every output index when upscaling with nearest neighbour, as cv2.resize picks it,
+# so that parts of an image can be upscaled on their own
+def nearestIndices( size, outputSize ):
+    return np.minimum( np.floor( np.arange( outputSize ) * ( 1. / ( outputSize / size ) ) ).astype( int ), size - 1 )
+
+
 #---------- main excutables ----------#
 
 
 # perform pixelization in one run
-def pixelize( image, nColours, recolour, superpixelSize ):
-    colours, pixelMap = getPalette( image, nColours )
+def pixelize( image, nColours, recolour, superpixelSize, seed = None, paletteSample = None, paletteCache = None,
+              palette = None, paletteMap = None, profile = NO_PROFILE ):
+    with profile.stage( 'palette' ):
+        if palette is None:
+            colours, pixelMap = getPalette( image, nColours, seed, paletteSample, paletteCache )
+        else:
+            colours, pixelMap = palette, getPixelMap( image, palette )
+
+    if paletteMap is not None:
+        colours = remapPalette( colours, paletteMap )
 
     if recolour:
+        from recolourGUI import startGUI
         colours = startGUI( image, colours )
 
-    lessColourImage = reduceColour( image, colours, pixelMap )
-    blurredImage = smoothenImage( lessColourImage )
-    pixelizedImage = pixelateImage( blurredImage, superpixelSize )
+    with profile.stage( 'reduce' ):
+        lessColourImage = reduceColour( image, colours, pixelMap )
+    with profile.stage( 'smooth' ):
+        blurredImage = smoothenImage( lessColourImage )
+    with profile.stage( 'pixelate' ):
+        pixelizedImage = pixelateImage( blurredImage, superpixelSize )
+    profile.count( 'pixels', image.shape[0] * image.shape[1] )
 
     return pixelizedImage
 
@@ -110,15 +233,28 @@ def pixelize( image, nColours, recolour, superpixelSize ):
 # separate pixelization in two parts to fit texture generation
 
 # P1: preprocess image with palette recolouring & downsizing
-def pixelizeP1( image, nColours, recolour, superpixelSize ):
-    colours, pixelMap = getPalette( image, nColours )
+def pixelizeP1( image, nColours, recolour, superpixelSize, seed = None, paletteSample = None, paletteCache = None,
+                palette = None, paletteMap = None, profile = NO_PROFILE ):
+    with profile.stage( 'palette' ):
+        if palette is None:
+            colours, pixelMap = getPalette( image, nColours, seed, paletteSample, paletteCache )
+        else:
+            colours, pixelMap = palette, getPixelMap( image, palette )
+
+    if paletteMap is not None:
+        colours = remapPalette( colours, paletteMap )
 
     if recolour:
+        from recolourGUI import startGUI
         colours = startGUI( image, colours )
 
-    lessColourImage = reduceColour( image, colours, pixelMap )
-    blurredImage = smoothenImage( lessColourImage )
-    pixelizedImage = pixelateDown( blurredImage, superpixelSize )
+    with profile.stage( 'reduce' ):
+        lessColourImage = reduceColour( image, colours, pixelMap )
+    with profile.stage( 'smooth' ):
+        blurredImage = smoothenImage( lessColourImage )
+    with profile.stage( 'pixelate' ):
+        pixelizedImage = pixelateDown( blurredImage, superpixelSize )
+    profile.count( 'pixels', image.shape[0] * image.shape[1] )
 
     return pixelizedImage
 
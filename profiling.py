@@ -0,0 +1,63 @@
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+
+#---------- classes ----------#
+
+
+# times and counts of the stages of a run, nested stages being named by their path,
+# e.g. 'generate/maxflow' for maxflow within generation; stages may be timed from several
+# threads, each with paths of its own
+class Profile:
+    def __init__( self ):
+        self.seconds = defaultdict( float )
+        self.calls = defaultdict( int )
+        self.counts = defaultdict( int )
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    # time the enclosed block as a stage
+    @contextmanager
+    def stage( self, name ):
+        if not hasattr( self.local, 'path' ):
+            self.local.path = []
+        self.local.path.append( name )
+        key = '/'.join( self.local.path )
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.seconds[ key ] += time.perf_counter() - start
+                self.calls[ key ] += 1
+            self.local.path.pop()
+
+    # add to a counter
+    def count( self, name, n = 1 ):
+        with self.lock:
+            self.counts[ name ] += int( n )
+
+    # stages and counters as plain dictionaries, total time being that of the outermost stages
+    def report( self ):
+        return {
+            'seconds': sum( s for key, s in self.seconds.items() if '/' not in key ),
+            'stages': { key: { 'seconds': s, 'calls': self.calls[ key ] } for key, s in self.seconds.items() },
+            'counts': dict( self.counts )
+        }
+
+
+# profile that records nothing, so that instrumented code costs next to nothing when not profiled
+class NullProfile:
+    def stage( self, name ):
+        return nullcontext()
+
+    def count( self, name, n = 1 ):
+        pass
+
+
+#---------- constants ----------#
+
+
+NO_PROFILE = NullProfile()
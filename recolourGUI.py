@@ -1,5 +1,6 @@
 import sys
 import cv2
+import argparse
 import tkinter as tk
 from tkinter.colorchooser import askcolor
 from PIL import Image, ImageTk
@@ -117,3 +118,38 @@ def startGUI( image, colours ):
         resultColours = colours[ : ]
 
     return resultColours
+
+
+# pick recolourings ahead of time and save them as a palette map for `generate.py --palette_map`,
+# so that batch runs never wait for the window
+def main():
+    parser = argparse.ArgumentParser( description = 'Recolour the palette of an image into a palette map file' )
+
+    parser.add_argument( '-i', '--input', type = str, required = True,
+            help =  'the image to extract the palette from' )
+
+    parser.add_argument( '-o', '--output', type = str, default = './palette_map.json',
+            help =  'the palette map file to be written' )
+
+    parser.add_argument( '--n_colors', type = int, default = 8,
+            help =  'the number of dominate colours to be extracted as a palette for the image' )
+
+    parser.add_argument( '--seed', type = int,
+            help =  'the seed of the palette extraction' )
+
+    args = parser.parse_args()
+
+    # palette extraction is only needed when run as a front end
+    from pixelization import getPalette, savePaletteMap
+
+    image = cv2.imread( args.input, cv2.IMREAD_UNCHANGED )
+    if image is None:
+        sys.exit( f'{ args.input } does not exist' )
+
+    colours, _ = getPalette( image, args.n_colors, args.seed )
+    newColours = startGUI( image, colours.copy() )
+    savePaletteMap( args.output, colours, newColours )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# the modules of the repository are imported from its root, as generate.py does
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+import custom_io
+
+custom_io.STATUS_OUT = False
+
+
+# strip of two flat bands side by side with a little noise, on which the weights of most
+# placements underflow as subpatches within one band cost far more than their variance
+@pytest.fixture
+def lowVarianceStrip():
+    rng = np.random.default_rng( 0 )
+    image = np.zeros( ( 40, 160, 3 ), np.int32 )
+    image[ :, :80 ] = 90
+    image[ :, 80: ] = 160
+    return np.clip( image + rng.integers( -3, 4, image.shape ), 0, 255 ).astype( np.uint8 )
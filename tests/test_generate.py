@@ -0,0 +1,27 @@
+import pytest
+
+from generate import getArguments, Pipeline, processInParallel, processInSequence
+
+
+# results are cached without --stream among their arguments, so both ways must make the same ones
+@pytest.mark.parametrize( 'options', [ [], [ '--generation_only' ], [ '--search_scale', '4' ],
+                                      [ '--generation_only', '--search_scale', '4', '--patch_factor', '4',
+                                        '--generation_mode', '1' ] ] )
+def test_streamed_results_match_full_canvas( lowVarianceStrip, tmp_path, options ):
+    results = []
+    for stream in ( [], [ '--stream' ] ):
+        args = getArguments( [ '-i', str( tmp_path ), '-o', str( tmp_path ), '--seed', '0' ] + options + stream )
+        results.append( Pipeline( args ).processImage( lowVarianceStrip, 'strip.png' )[0] )
+
+    assert ( results[0] == results[1] ).all()
+
+
+# an image that cannot be decoded fails the batch the same way with and without workers
+@pytest.mark.parametrize( 'workers', [ 1, 2 ] )
+def test_undecodable_image_is_a_failure( tmp_path, workers ):
+    ( tmp_path / 'garbage.png' ).write_bytes( b'not an image' )
+    args = getArguments( [ '-i', str( tmp_path ), '-o', str( tmp_path / 'output' ), '--workers', str( workers ) ] )
+
+    failures = ( processInParallel if workers > 1 else processInSequence )( args )
+
+    assert [ sp for sp, _ in failures ] == [ 'garbage.png' ]
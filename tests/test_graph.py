@@ -0,0 +1,43 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from benchmark import getPartialGraph
+from graphEnums import CostMethod, GenMethod
+
+# largest cost difference between backends allowed, relative to the pattern variance plus the cost,
+# as placements are weighed by their cost over the variance while the float32 sums of the
+# template backend keep about 7 significant digits of costs far above it
+PARITY_TOLERANCE = 1e-4
+
+SAMPLE_PATH = os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ),
+                            'samples', 'liu3cropped.png' )
+
+
+# sample image downscaled as the cost benchmark does by default
+@pytest.fixture
+def sample():
+    image = cv2.imread( SAMPLE_PATH )
+    return cv2.resize( image, ( image.shape[1] // 3, image.shape[0] // 3 ), interpolation = cv2.INTER_LINEAR )
+
+
+# both backends score every placement of a partly filled canvas the same
+@pytest.mark.parametrize( 'mode', list( GenMethod ) )
+@pytest.mark.parametrize( 'image', [ 'sample', 'lowVarianceStrip' ] )
+def test_cost_backends_agree( image, mode, request ):
+    g, pattern = getPartialGraph( request.getfixturevalue( image ), mode, 8, 4, 8 )
+    rowRange = range( g.h - pattern.shape[0] + 1 )
+    colRange = range( g.w - pattern.shape[1] + 1 )
+
+    costs = {}
+    for method in CostMethod:
+        g.cost_method = method
+        costs[ method ], maskCount = g.placement_cost_fn( pattern, rowRange, colRange )
+
+    sigma = np.std( pattern.reshape( -1, g.channels ), axis = 0 )
+    covered = maskCount > 0
+    expected = costs[ CostMethod.FILTER_2D ][ covered ]
+    error = np.abs( expected - costs[ CostMethod.MATCH_TEMPLATE ][ covered ] ) / ( ( sigma * sigma ).sum() + expected )
+    assert error.max() <= PARITY_TOLERANCE
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import graphCut as graphCutModule
+from graphCut import graphCut
+from graphEnums import GenDirection, GenMethod
+
+
+# generate a horizontal strip through the stream callback, gathering the flushed columns
+def generateStreamed( image, mode, width, seed, searchScale = 1 ):
+    output = np.zeros( ( image.shape[0], width, image.shape[2] ), np.uint8 )
+    def stream( columns, col ):
+        output[ :, col:col+columns.shape[1] ] = columns
+
+    graphCut( image, GenDirection.HORIZONAL, 8, mode, image.shape[0], width, seed = seed, stream = stream,
+              searchScale = searchScale )
+    return output
+
+
+# the coarse placement grid follows the output columns, so the window may slide by any amount
+@pytest.mark.parametrize( 'mode', list( GenMethod ) )
+@pytest.mark.parametrize( 'seed', [ 0, 1, 2 ] )
+@pytest.mark.parametrize( 'searchScale', [ 1, 3, 4 ] )
+def test_streamed_output_matches_full_canvas( lowVarianceStrip, mode, seed, searchScale ):
+    width = 6*lowVarianceStrip.shape[1]
+    full = graphCut( lowVarianceStrip, GenDirection.HORIZONAL, 8, mode, lowVarianceStrip.shape[0], width, seed = seed,
+                     searchScale = searchScale )
+
+    np.testing.assert_array_equal( generateStreamed( lowVarianceStrip, mode, width, seed, searchScale ), full )
+
+
+@pytest.mark.parametrize( 'mode', list( GenMethod ) )
+@pytest.mark.parametrize( 'seed', [ 0, 1, 2 ] )
+def test_tileable_output_repeats_its_left_edge( lowVarianceStrip, mode, seed, monkeypatch ):
+    graphs = []
+    class RecordedGraph( graphCutModule.Graph ):
+        def __init__( self, *args, **kwargs ):
+            super().__init__( *args, **kwargs )
+            graphs.append( self )
+    monkeypatch.setattr( graphCutModule, 'Graph', RecordedGraph )
+
+    width = 3*lowVarianceStrip.shape[1]
+    tile = graphCut( lowVarianceStrip, GenDirection.HORIZONAL, 8, mode, lowVarianceStrip.shape[0], width,
+                     seed = seed, wrap = True )
+
+    # the canvas past the end of the tile must still be a copy of the start of the tile
+    g = graphs[0]
+    after = g.canvas[ :, g.locked_col: ].astype( np.uint8 )
+    np.testing.assert_array_equal( after, tile[ :, :after.shape[1] ] )